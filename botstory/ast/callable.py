@@ -1,5 +1,5 @@
 import logging
-from . import processor
+from . import processor, stack_codec
 from .. import matchers
 
 logger = logging.getLogger(__name__)
@@ -45,6 +45,7 @@ class CallableNodeWrapper:
             raise AttributeError('Got {} and {}. Should pass session as well'.format(args, kwargs))
 
         session = kwargs.pop('session')
+        session['stack'] = stack_codec.decode_stack(session['stack'])
 
         # we are going deeper so prepare one more item in stack
         logger.debug('  action: extend stack by +1')
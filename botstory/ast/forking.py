@@ -31,8 +31,8 @@ class Middleware:
 
     def process(self, data, validation_result):
         logger.debug('process_switch')
-        logger.debug('  data: {}'.format(data))
-        logger.debug('  validation_result: {}'.format(validation_result))
+        logger.debug('  data: %s', data)
+        logger.debug('  validation_result: %s', validation_result)
         # logger.debug('  children len {}'.format(len(data['story'].children)))
         case_story = match_children(data, 'case_id', validation_result)
         if len(case_story) == 0:
@@ -44,10 +44,10 @@ class Middleware:
             logger.debug('   do not have any fork here')
             return data
 
-        logger.debug('  got case_story {}'.format(case_story[0]))
+        logger.debug('  got case_story %s', case_story[0])
 
         last_stack_item = data['stack_tail'][-1]
-        logger.debug('iterate {} step further'.format(last_stack_item['topic']))
+        logger.debug('iterate %s step further', last_stack_item['topic'])
         new_stack_item = {
             'step': last_stack_item['step'] + 1,
             # 'step': last_stack_item['step'],
@@ -112,8 +112,8 @@ async def process_switch_on_value(compiled_story, idx, message, processor, sessi
         bubble_up=False)
 
     logger.debug('  after process_next_part_of_story')
-    logger.debug('      waiting_for = {}'.format(waiting_for))
-    logger.debug('      session.stack = {}'.format(session['stack']))
+    logger.debug('      waiting_for = %s', waiting_for)
+    logger.debug('      session.stack = %s', session['stack'])
 
     return waiting_for
 
@@ -1,5 +1,5 @@
 import logging
-import itertools
+import re
 
 from . import parser
 from .. import di
@@ -16,53 +16,233 @@ class StoriesLibrary:
     def __init__(self):
         self.message_handling_stories = []
         self.callable_stories = []
+        # matcher type -> (matcher class, {dispatch key -> (order, story)})
+        self.dispatch_index = {}
+        # source of text -> [(order, story, pattern)] of matchers with `dispatch_pattern`
+        self.pattern_handlers = {}
+        # source of text -> (combined regex, {group: (idx, order, story)})
+        self.pattern_index = {}
+        # handlers which validators can't be indexed, in order of registration
+        self.generic_handlers = []
+        # topic -> top level story (callable stories go first)
+        self.stories_by_topic = {}
+        self.callables_by_topic = {}
+        # parent story -> {topic -> child story of its forks}
+        self.children_by_parent = {}
 
     def clear(self):
         self.message_handling_stories = []
         self.callable_stories = []
+        self.dispatch_index = {}
+        self.pattern_handlers = {}
+        self.pattern_index = {}
+        self.generic_handlers = []
+        self.stories_by_topic = {}
+        self.callables_by_topic = {}
+        self.children_by_parent = {}
 
     def add_message_handler(self, story):
+        order = len(self.message_handling_stories)
         self.message_handling_stories.append(story)
+        self.index_message_handler(order, story)
+        self.index_topic(story)
 
     def add_callable(self, story):
         self.callable_stories.append(story)
+        self.callables_by_topic.setdefault(story.topic, story)
+        self.index_topic(story)
+
+    def index_topic(self, story):
+        """
+        register top level story by its topic
+        and index all forked sub-stories of it
+
+        :param story:
+        :return:
+        """
+        if story.topic in self.stories_by_topic:
+            logger.warning('Already have story with topic {}. Please use uniq name'.format(story.topic))
+
+        # callable stories have priority over message handlers
+        self.stories_by_topic[story.topic] = self.callables_by_topic.get(story.topic, None) or \
+                                             self.stories_by_topic.get(story.topic, None) or \
+                                             story
+        self.index_children(story)
+
+    def index_children(self, parent):
+        children = {}
+        for fork in parent.story_line:
+            if not isinstance(fork, parser.StoryPartFork):
+                continue
+            for child in fork.children:
+                if child.topic in children:
+                    raise DuplicateTopicError(
+                        'We have few options with the same name {} in {}'.format(child.topic, parent.topic))
+                children[child.topic] = child
+                self.index_children(child)
+        if children:
+            self.children_by_parent[parent] = children
+
+    def index_message_handler(self, order, story):
+        """
+        put story to the dispatch index if its validator knows
+        its dispatch key (matchers with `dispatch_key` and `message_dispatch_key`),
+        otherwise story will be checked by ordered scan
+
+        :param order: order of registration
+        :param story:
+        :return:
+        """
+        validator = story.extensions.get('validator', None)
+        if hasattr(validator, 'dispatch_pattern') and hasattr(validator, 'message_dispatch_text'):
+            pattern = validator.dispatch_pattern()
+            if can_combine(pattern):
+                get_text = type(validator).message_dispatch_text
+                self.pattern_handlers.setdefault(get_text, []).append((order, story, pattern))
+                # should be rebuilt
+                self.pattern_index.pop(get_text, None)
+                return
+        if hasattr(validator, 'dispatch_key') and hasattr(validator, 'message_dispatch_key'):
+            _, index = self.dispatch_index.setdefault(validator.type, (type(validator), {}))
+            try:
+                # the first registered story wins
+                index.setdefault(validator.dispatch_key(), (order, story))
+                return
+            except TypeError:
+                # unhashable key (for example dict payload of option)
+                pass
+        self.generic_handlers.append((order, story))
 
     def get_callable_by_topic(self, topic):
-        return [s for s in self.callable_stories if s.topic == topic][0]
+        return self.callables_by_topic[topic]
 
     def get_right_story(self, message):
-        matched_stories = [story for story in self.message_handling_stories
-                           if story.extensions['validator'].validate(message)]
-        return matched_stories[0] if len(matched_stories) > 0 else None
+        """
+        get the first registered story which validator accepts message
 
-    def get_story_by_topic(self, topic, stack=[]):
+        :param message:
+        :return:
+        """
+        matched = None
+        for matcher_type, index in self.dispatch_index.values():
+            try:
+                candidate = index.get(matcher_type.message_dispatch_key(message), None)
+            except TypeError:
+                # unhashable value can't be in index
+                continue
+            if candidate and (not matched or candidate[0] < matched[0]):
+                matched = candidate
+
+        for get_text in self.pattern_handlers.keys():
+            candidate = self.match_patterns(get_text, message)
+            if candidate and (not matched or candidate[0] < matched[0]):
+                matched = candidate
+
+        for order, story in self.generic_handlers:
+            if matched and matched[0] < order:
+                break
+            if story.extensions['validator'].validate(message):
+                matched = order, story
+                break
+
+        return matched[1] if matched else None
+
+    def get_pattern_index(self, get_text):
+        """
+        combine patterns of all handlers into one regex
+        so one pass over the text finds the earliest matched handler.
+        patterns are alternatives of one lookahead, in order of handlers,
+        so at each position of text we only see the earliest handler
+        which matches there
+
+        :param get_text: source of text for patterns
+        :return: (combined regex, {group name: (idx, order, story)})
+        """
+        index = self.pattern_index.get(get_text, None)
+        if index is None:
+            handlers = {}
+            alternatives = []
+            for idx, (order, story, pattern) in enumerate(self.pattern_handlers[get_text]):
+                group = '_dispatch_{}'.format(idx)
+                handlers[group] = idx, order, story
+                alternatives.append('(?P<{}>{})'.format(group, pattern))
+            combined = re.compile(build_lookahead('|'.join(alternatives)))
+            index = self.pattern_index[get_text] = combined, handlers
+        return index
+
+    def match_patterns(self, get_text, message):
+        text = get_text(message)
+        if text is None:
+            return None
+        combined, handlers = self.get_pattern_index(get_text)
+        best = None
+        for match in combined.finditer(text):
+            idx, order, story = handlers[match.lastgroup]
+            if best is None or idx < best[0]:
+                best = idx, order, story
+                if idx == 0:
+                    # nobody could be earlier
+                    break
+        return best and best[1:]
+
+    def get_story_by_topic(self, topic, stack=None):
         """
         get story and take about context stack
         :param topic:
         :param stack:
         :return:
         """
-        options = [s for s in [*self.callable_stories, *self.message_handling_stories] if s.topic == topic]
-
-        if len(options) > 0:
-            return options[0]
-
-        if len(options) == 0 and stack and len(stack) > 0:
-            parent = self.get_story_by_topic(stack[-1]['topic'], stack[:-2])
-            if not parent:
-                return None
-            inner_stories = [
-                story.children for story in parent.story_line if isinstance(story, parser.StoryPartFork)
-            ]
-
-            inner_stories = [item for sublist in inner_stories for item in sublist]
-
-            child_options = [story for story in inner_stories if story.topic == topic]
-            if len(child_options) == 0:
-                return None
-            elif len(child_options) == 1:
-                return child_options[0]
-            else:
-                raise Error('We have few options with the same name {}'.format(topic))
-
-        return None
+        stack = stack or []
+        return self.find_story_by_topic(topic, stack, len(stack))
+
+    def find_story_by_topic(self, topic, stack, depth):
+        """
+        the same as get_story_by_topic but only first `depth` items of stack
+        are used so we don't need to copy stack on each level of recursion
+
+        :param topic:
+        :param stack:
+        :param depth:
+        :return:
+        """
+        story = self.stories_by_topic.get(topic, None)
+        if story is not None or depth <= 0:
+            return story
+
+        parent = self.find_story_by_topic(stack[depth - 1]['topic'], stack, depth - 2)
+        if not parent:
+            return None
+
+        return self.children_by_parent.get(parent, {}).get(topic, None)
+
+
+def build_lookahead(pattern):
+    return '(?=(?:{}))'.format(pattern)
+
+
+# back references, named groups (they could clash)
+# and conditional references to numbered groups (they would be renumbered)
+NOT_COMBINABLE = re.compile(r'\\[1-9]|\(\?P[<=]|\(\?\(\d')
+# global inline flags, like (?i), would be applied to the whole combined regex
+GLOBAL_FLAGS = re.compile(r'(?<!\\)\(\?[aiLmsux]+\)')
+
+
+def can_combine(pattern):
+    """
+    pattern with back references, named groups (they could clash),
+    conditional references or global flags can't be a part of combined regex
+
+    :param pattern:
+    :return:
+    """
+    if pattern is None or NOT_COMBINABLE.search(pattern) or GLOBAL_FLAGS.search(pattern):
+        return False
+    try:
+        re.compile(build_lookahead('(?P<_test>{})'.format(pattern)))
+    except re.error:
+        return False
+    return True
+
+
+class DuplicateTopicError(Exception):
+    pass
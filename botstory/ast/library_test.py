@@ -1,5 +1,7 @@
 import pytest
+import re
 from . import library, parser
+from ..middlewares import any, location, option, text
 
 
 @pytest.fixture(scope='function')
@@ -35,3 +37,175 @@ def test_get_substory(story_library):
     }]
     story = story_library.get_story_by_topic('How do you feel?', stack=stack)
     assert story.topic == 'How do you feel?'
+
+
+def build_message_handler(topic, validator):
+    story = parser.ASTNode(topic)
+    story.extensions['validator'] = validator
+    return story
+
+
+def answer_text(raw):
+    return {'data': {'text': {'raw': raw}}}
+
+
+def test_get_right_story_by_exact_text():
+    lib = library.StoriesLibrary()
+    lib.add_message_handler(build_message_handler('hi', text.Match('hi!')))
+    lib.add_message_handler(build_message_handler('bye', text.Match('bye!')))
+
+    assert lib.get_right_story(answer_text('bye!')).topic == 'bye'
+    assert lib.get_right_story(answer_text('hello!')) is None
+
+
+def test_get_right_story_by_option_payload():
+    lib = library.StoriesLibrary()
+    lib.add_message_handler(build_message_handler('green', option.Match('green')))
+    lib.add_message_handler(build_message_handler('on_start', option.OnStart()))
+
+    assert lib.get_right_story({'data': {'option': 'green'}}).topic == 'green'
+    assert lib.get_right_story({
+        'data': {'option': option.OnStart.DEFAULT_OPTION_PAYLOAD}
+    }).topic == 'on_start'
+
+
+def test_first_registered_story_wins():
+    lib = library.StoriesLibrary()
+    lib.add_message_handler(build_message_handler('any_text', text.Any()))
+    lib.add_message_handler(build_message_handler('hi', text.Match('hi!')))
+
+    assert lib.get_right_story(answer_text('hi!')).topic == 'any_text'
+
+
+def test_exact_match_wins_over_later_generic_validator():
+    lib = library.StoriesLibrary()
+    lib.add_message_handler(build_message_handler('hi', text.Match('hi!')))
+    lib.add_message_handler(build_message_handler('any', any.Any()))
+
+    assert lib.get_right_story(answer_text('hi!')).topic == 'hi'
+    assert lib.get_right_story(answer_text('bye!')).topic == 'any'
+
+
+def test_generic_validator_wins_over_later_exact_match():
+    lib = library.StoriesLibrary()
+    lib.add_message_handler(build_message_handler('any_of', any.AnyOf([text.Match('hi!'), location.Any()])))
+    lib.add_message_handler(build_message_handler('hi', text.Match('hi!')))
+
+    assert lib.get_right_story(answer_text('hi!')).topic == 'any_of'
+
+
+def test_unhashable_payload_fallbacks_to_scan():
+    lib = library.StoriesLibrary()
+    lib.add_message_handler(build_message_handler('health', option.Match({'health': 1})))
+    lib.add_message_handler(build_message_handler('any_option', option.Any()))
+
+    assert lib.get_right_story({'data': {'option': {'health': 1}}}).topic == 'health'
+    assert lib.get_right_story({'data': {'option': {'health': 0}}}).topic == 'any_option'
+
+
+def test_get_right_story_by_combined_patterns():
+    lib = library.StoriesLibrary()
+    lib.add_message_handler(build_message_handler('price', text.Contains(['price', 'cost'])))
+    lib.add_message_handler(build_message_handler('order', text.Regex(r'^order #(\d+)$')))
+    lib.add_message_handler(build_message_handler('hello', text.Regex('hel+o', re.IGNORECASE)))
+
+    # scoped flags (ignore case) need python>=3.6 otherwise handler is scanned
+    combined = lib.pattern_handlers[text.Regex.message_dispatch_text]
+    assert 'order' in [story.topic for _, story, _ in combined]
+    assert len(combined) + len(lib.generic_handlers) == 3
+    assert lib.get_right_story(answer_text('order #42')).topic == 'order'
+    assert lib.get_right_story(answer_text('HELLO, what does it cost?')).topic == 'price'
+    assert lib.get_right_story(answer_text('Hello!')).topic == 'hello'
+    assert lib.get_right_story(answer_text('costume')) is None
+    assert lib.get_right_story({'data': {'location': {}}}) is None
+
+
+def test_earlier_handler_wins_over_later_pattern():
+    lib = library.StoriesLibrary()
+    lib.add_message_handler(build_message_handler('hi', text.EqualCaseIgnore('Hi')))
+    lib.add_message_handler(build_message_handler('any_greeting', text.Contains('hi')))
+    lib.add_message_handler(build_message_handler('any_text', text.Any()))
+
+    assert lib.get_right_story(answer_text('HI')).topic == 'hi'
+    assert lib.get_right_story(answer_text('oh, hi')).topic == 'any_greeting'
+    assert lib.get_right_story(answer_text('bye')).topic == 'any_text'
+
+
+def test_pattern_with_back_reference_fallbacks_to_scan():
+    lib = library.StoriesLibrary()
+    lib.add_message_handler(build_message_handler('repeat', text.Regex(r'(\w+) \1')))
+    lib.add_message_handler(build_message_handler('named', text.Regex(r'(?P<word>\w+)!')))
+
+    assert lib.pattern_handlers == {}
+    assert lib.get_right_story(answer_text('bye bye')).topic == 'repeat'
+    assert lib.get_right_story(answer_text('bye!')).topic == 'named'
+
+
+def test_pattern_with_conditional_reference_fallbacks_to_scan():
+    lib = library.StoriesLibrary()
+    validator = text.Regex(r'(x)?(?(1)y|z)')
+    lib.add_message_handler(build_message_handler('conditional', validator))
+
+    assert lib.pattern_handlers == {}
+    for message_text in ['xy', 'z', 'xz', 'y']:
+        message = answer_text(message_text)
+        story = lib.get_right_story(message)
+        assert (story is not None) == bool(validator.validate(message))
+    assert lib.get_right_story(answer_text('xy')).topic == 'conditional'
+
+
+def test_pattern_with_global_flags_fallbacks_to_scan():
+    lib = library.StoriesLibrary()
+    lib.add_message_handler(build_message_handler('hello', text.Regex('(?i)hello')))
+    lib.add_message_handler(build_message_handler('world', text.Regex('WORLD')))
+
+    assert [story.topic for _, story, _ in lib.pattern_handlers[text.Regex.message_dispatch_text]] == ['world']
+    assert lib.get_right_story(answer_text('world')) is None
+    assert lib.get_right_story(answer_text('HELLO world')).topic == 'hello'
+    assert lib.get_right_story(answer_text('WORLD')).topic == 'world'
+
+
+def test_find_earliest_handler_wherever_it_matches():
+    lib = library.StoriesLibrary()
+    lib.add_message_handler(build_message_handler('end', text.Regex('end$')))
+    lib.add_message_handler(build_message_handler('start', text.Regex('^start')))
+
+    assert lib.get_right_story(answer_text('start and end')).topic == 'end'
+    assert lib.get_right_story(answer_text('start and stop')).topic == 'start'
+    assert lib.get_right_story(answer_text('and start')) is None
+
+
+def test_get_substory_of_substory():
+    lib = library.StoriesLibrary()
+    root = parser.ASTNode('root')
+    child = parser.ASTNode('child')
+    grandchild = parser.ASTNode('grandchild')
+    child.append(parser.StoryPartFork())
+    child.add_child(grandchild)
+    root.append(parser.StoryPartFork())
+    root.add_child(child)
+    lib.add_message_handler(root)
+
+    stack = [{'topic': 'root'}, {'topic': None}, {'topic': 'child'}]
+    assert lib.get_story_by_topic('grandchild', stack=stack) == grandchild
+
+
+def test_callable_story_has_priority_over_message_handler_with_the_same_topic():
+    lib = library.StoriesLibrary()
+    handler = parser.ASTNode('greeting')
+    callable_story = parser.ASTNode('greeting')
+    lib.add_message_handler(handler)
+    lib.add_callable(callable_story)
+
+    assert lib.get_story_by_topic('greeting') == callable_story
+    assert lib.get_callable_by_topic('greeting') == callable_story
+
+
+def test_fail_on_registration_of_substories_with_the_same_topic():
+    story = parser.ASTNode('root')
+    story.append(parser.StoryPartFork())
+    story.add_child(parser.ASTNode('case'))
+    story.add_child(parser.ASTNode('case'))
+
+    with pytest.raises(library.DuplicateTopicError):
+        library.StoriesLibrary().add_message_handler(story)
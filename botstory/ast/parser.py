@@ -1,9 +1,26 @@
+import collections
 import logging
 import json
 import inspect
 
 logger = logging.getLogger(__name__)
 
+# kinds of story parts
+FORK = 'fork'
+SYNC = 'sync'
+ASYNC = 'async'
+
+# precompiled step of story so we don't need reflection on each call
+Step = collections.namedtuple('Step', ['part', 'name', 'kind'])
+
+
+def compile_step(story_part):
+    if isinstance(story_part, StoryPartFork):
+        return Step(story_part, story_part.__name__(), FORK)
+    if inspect.iscoroutinefunction(story_part):
+        return Step(story_part, story_part.__name__, ASYNC)
+    return Step(story_part, story_part.__name__, SYNC)
+
 
 class Parser:
     def __init__(self):
@@ -18,6 +35,7 @@ class Parser:
         one_story()
 
         res = self.current_node
+        res.compile_plan()
         self.current_node = None
         return res
 
@@ -49,6 +67,7 @@ class ASTNode:
     def __init__(self, topic):
         self.compiled_story = None
         self.extensions = {}
+        self.plan = None
         self.story_line = []
         self.story_names = set()
         self.topic = topic
@@ -69,6 +88,21 @@ class ASTNode:
 
         self.story_names.add(part_name)
         self.story_line.append(story_part)
+        self.plan = None
+
+    def compile_plan(self):
+        """
+        precompute kind of each step of story line
+
+        :return: list of Step
+        """
+        self.plan = [compile_step(story_part) for story_part in self.story_line]
+        return self.plan
+
+    def get_plan(self):
+        if self.plan is None:
+            return self.compile_plan()
+        return self.plan
 
     def to_json(self):
         return {
@@ -1,9 +1,10 @@
 import logging
-import inspect
+import time
 
-from . import parser, callable, forking
+from . import parser, callable, forking, stack_codec, trace
 from .. import di, matchers
 from ..integrations import mocktracker
+from ..utils import lock
 
 logger = logging.getLogger(__name__)
 
@@ -13,8 +14,18 @@ class StoryProcessor:
     def __init__(self, parser_instance, library, middlewares=[]):
         self.library = library
         self.middlewares = middlewares
+        # hooks of middlewares are resolved once
+        self.process_hooks = [m.process for m in middlewares
+                              if hasattr(m, 'process')]
+        self.process_validator_hooks = [m.process_validator for m in middlewares
+                                        if hasattr(m, 'process_validator')]
         self.parser_instance = parser_instance
         self.tracker = mocktracker.MockTracker()
+        self.trace_recorder = None
+        self.stack_codec = None
+        self.metrics = None
+        # messages of one session are processed one by one
+        self.session_lock = lock.KeyLock()
 
     @di.inject()
     def add_tracker(self, tracker):
@@ -24,31 +35,102 @@ class StoryProcessor:
             return
         self.tracker = tracker
 
+    @di.inject()
+    def add_trace_recorder(self, trace_recorder):
+        logger.debug('add_trace_recorder')
+        logger.debug(trace_recorder)
+        self.trace_recorder = trace_recorder
+
+    @di.inject()
+    def add_stack_codec(self, stack_codec):
+        logger.debug('add_stack_codec')
+        logger.debug(stack_codec)
+        self.stack_codec = stack_codec
+
+    @di.inject()
+    def add_metrics(self, metrics):
+        logger.debug('add_metrics')
+        logger.debug(metrics)
+        self.metrics = metrics
+
+    def get_trace_recorder(self, message):
+        """
+        get trace recorder only if it is enabled for user of message
+
+        :param message:
+        :return:
+        """
+        if self.trace_recorder and message and \
+                self.trace_recorder.is_traced(message['user']):
+            return self.trace_recorder
+        return None
+
     async def match_message(self, message):
         """
         because match_message is recursive we split function to
         public match_message and private _match_message
 
+        messages of different sessions are processed concurrently
+        but messages of the same session wait for each other
+        because we change stack of session in place.
+        so story part shouldn't call match_message for its own session
+
         :param message:
         :return:
         """
-        logger.debug('')
-        logger.debug('> match_message <')
-        logger.debug('')
-        logger.debug('  {} '.format(message))
-        logger.debug('self.tracker')
-        logger.debug(self.tracker)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('')
+            logger.debug('> match_message <')
+            logger.debug('')
+            logger.debug('  %s ', message)
         self.tracker.new_message(
             user=message and message['user'],
             data=message['data'],
         )
-        return await self._match_message(message)
+        session = message['session']
+        metrics = self.metrics
+        if metrics:
+            metrics.increment('messages')
+            started_at = time.perf_counter()
+        async with self.session_lock(get_session_key(session)):
+            if metrics:
+                locked_at = time.perf_counter()
+                metrics.observe('stage_seconds', locked_at - started_at, stage='session_lock')
+            session['stack'] = stack_codec.decode_stack(session['stack'])
+            recorder = self.get_trace_recorder(message)
+            if recorder:
+                recorder.record(message['user'], 'match_message',
+                                data=message['data'],
+                                stack=trace.copy_stack(session['stack']))
+            try:
+                return await self._match_message(message)
+            finally:
+                if self.stack_codec:
+                    session['stack'] = self.stack_codec.encode_stack(session['stack'])
+                if metrics:
+                    metrics.observe('stage_seconds', time.perf_counter() - locked_at, stage='match_message')
 
     async def _match_message(self, message):
+        """
+        once story is over it passes message to the story below it in the stack.
+        we repeat matching in the loop instead of recursion
+        so the depth of stack doesn't cost us depth of calls
+
+        :param message:
+        :return:
+        """
+        while True:
+            waiting_for = await self.match_stack(message)
+            if waiting_for is not BubbleUp:
+                return waiting_for
+
+    async def match_stack(self, message):
         session = message['session']
+        debug = logger.isEnabledFor(logging.DEBUG)
         if len(session['stack']) > 0:
-            logger.debug('  check stack')
-            logger.debug('    session.stack = {}'.format(session['stack']))
+            if debug:
+                logger.debug('  check stack')
+                logger.debug('    session.stack %s', describe_stack(session['stack']))
             stack_tail = None
             while True:
                 if len(session['stack']) == 0:
@@ -70,26 +152,30 @@ class StoryProcessor:
                 validator = matchers.deserialize(stack_tail['data'])
                 if hasattr(validator, 'immediately') and validator.immediately:
                     return
-                if stack_tail['step'] < len(
-                        self.library.get_story_by_topic(stack_tail['topic'], stack=session['stack']).story_line
-                ):
+                compiled_story = self.library.get_story_by_topic(stack_tail['topic'], stack=session['stack'])
+                if stack_tail['step'] < len(compiled_story.story_line):
                     # if we haven't reach last step in list of story so we can parse result
                     break
 
-            logger.debug('    after check session.stack = {}'.format(session['stack']))
-            if stack_tail:
-                logger.debug('      topic {}'.format(stack_tail['topic']))
-                logger.debug('      step {}'.format(stack_tail['step']))
-            logger.debug('      stack_tail = {}'.format(stack_tail))
+            if debug:
+                logger.debug('    after check session.stack %s', describe_stack(session['stack']))
+                logger.debug('      stack_tail = %s', stack_tail)
             if stack_tail and stack_tail['data']:
                 logger.debug('  got it!')
-                validator = matchers.deserialize(stack_tail['data'])
+                # validator of stack_tail was deserialized in the loop above
                 validation_result = validator.validate(message)
-                logger.debug('      validation_result {}'.format(validation_result))
+                logger.debug('      validation_result %s', validation_result)
+                recorder = self.get_trace_recorder(message)
+                if recorder:
+                    recorder.record(message['user'], 'validate',
+                                    topic=stack_tail['topic'],
+                                    step=stack_tail['step'],
+                                    validator=stack_tail['data'],
+                                    result=not not validation_result)
                 if not not validation_result:
                     return await self.process_next_part_of_story({
                         'step': stack_tail['step'],
-                        'story': self.library.get_story_by_topic(stack_tail['topic'], stack=session['stack']),
+                        'story': compiled_story,
                         'stack_tail': [stack_tail],
                     },
                         validation_result, session, message,
@@ -98,7 +184,18 @@ class StoryProcessor:
         if len(session['stack']) == 0:
             session['stack'] = [build_empty_stack_item()]
 
+        metrics = self.metrics
+        if metrics:
+            started_at = time.perf_counter()
         compiled_story = self.library.get_right_story(message)
+        if metrics:
+            metrics.observe('stage_seconds', time.perf_counter() - started_at, stage='dispatch')
+            if not compiled_story:
+                metrics.increment('unmatched_messages')
+        recorder = self.get_trace_recorder(message)
+        if recorder:
+            recorder.record(message['user'], 'get_right_story',
+                            topic=compiled_story and compiled_story.topic)
         if not compiled_story:
             return
         return await self.process_story(
@@ -111,47 +208,60 @@ class StoryProcessor:
 
     async def process_story(self, session, message, compiled_story, idx=0, story_args=[], story_kwargs={},
                             bubble_up=True):
-        logger.debug('')
-        logger.debug('process_story')
-        logger.debug('')
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug('')
+            logger.debug('process_story')
+            logger.debug('')
 
-        logger.debug('  bubble_up {}'.format(bubble_up))
-        logger.debug('! topic {}'.format(compiled_story.topic))
-        logger.debug('! step {}'.format(idx))
-        logger.debug('  story {}'.format(compiled_story))
-        logger.debug('  message {}'.format(message))
-        logger.debug('  session.stack {} ({})'.format(session['stack'], len(session['stack'])))
-        logger.debug(
-            '  previous_topics: {}'.format(session['stack'][-2]['topic'] if len(session['stack']) > 1 else None))
+            logger.debug('  bubble_up %s', bubble_up)
+            logger.debug('! topic %s', compiled_story.topic)
+            logger.debug('! step %s', idx)
+            logger.debug('  story %s', compiled_story)
+            logger.debug('  data %s', message and message['data'])
+            logger.debug('  session.stack %s', describe_stack(session['stack']))
+            logger.debug('  previous_topics: %s',
+                         session['stack'][-2]['topic'] if len(session['stack']) > 1 else None)
 
-        story_line = compiled_story.story_line
+        recorder = self.get_trace_recorder(message)
+        metrics = self.metrics
+
+        plan = compiled_story.get_plan()
+        plan_len = len(plan)
 
         current_stack_level = len(session['stack']) - 1
         session['stack'][-1]['topic'] = compiled_story.topic
 
         waiting_for = None
 
-        while idx < len(story_line):
-            logger.debug('')
-            logger.debug('  next iteration of {}'.format(compiled_story.topic))
-            logger.debug('      idx = {} ({})'.format(idx, len(story_line)))
-            logger.debug('      session {}'.format(session['stack']))
+        while idx < plan_len:
+            story_part, part_name, kind = plan[idx]
 
-            story_part = story_line[idx]
+            if debug:
+                logger.debug('')
+                logger.debug('  next iteration of %s', compiled_story.topic)
+                logger.debug('      idx = %s (%s)', idx, plan_len)
+                logger.debug('      session.stack %s', describe_stack(session['stack']))
+                logger.debug('  going to call: %s', part_name)
 
-            logger.debug('  going to call: {}'.format(story_part.__name__))
+            if recorder:
+                recorder.record(message['user'], 'story_part',
+                                topic=compiled_story.topic,
+                                step=idx,
+                                part=part_name)
 
-            logger.debug('self.tracker')
-            logger.debug(self.tracker)
             self.tracker.story(
                 user=message and message['user'],
                 story_name=compiled_story.topic,
-                story_part_name=story_part.__name__,
+                story_part_name=part_name,
             )
 
             # TODO: just should skip story part
             # but it should be done in process_next_part_of_story
-            if not isinstance(story_part, parser.StoryPartFork):
+            if kind is not parser.FORK:
+                if metrics:
+                    started_at = time.perf_counter()
+
                 if message:
                     # process common story part
                     waiting_for = story_part(message)
@@ -159,10 +269,16 @@ class StoryProcessor:
                     # process startpoint of callable story
                     waiting_for = story_part(*story_args, **story_kwargs)
 
-                if inspect.iscoroutinefunction(story_part):
+                if kind is parser.ASYNC:
                     waiting_for = await waiting_for
 
-                logger.debug('  got result {}'.format(waiting_for))
+                if metrics:
+                    # time of part includes callable stories which it has called
+                    metrics.observe('story_part_seconds', time.perf_counter() - started_at,
+                                    topic=compiled_story.topic,
+                                    part=part_name)
+
+                logger.debug('  got result %s', waiting_for)
 
             idx += 1
             if len(session['stack']) > current_stack_level:
@@ -203,37 +319,46 @@ class StoryProcessor:
 
             logger.debug('  action: reduce stack -1')
             session['stack'].pop()
-            logger.debug('  session.stack = {}'.format(session['stack']))
+            if debug:
+                logger.debug('  session.stack %s', describe_stack(session['stack']))
+
+            if recorder:
+                recorder.record(message['user'], 'bubble_up',
+                                topic=compiled_story.topic,
+                                stack=trace.copy_stack(session['stack']))
 
             if message:
                 if bubble_up:
-                    waiting_for = await self._match_message(message)
+                    # _match_message passes message further
+                    return BubbleUp
                 else:
                     logger.debug('  we reject bubbling in this call')
 
         return waiting_for
 
     async def process_next_part_of_story(self, received_data, validation_result, session, message, bubble_up=True):
-        logger.debug('')
-        logger.debug('process_next_part_of_story')
-        logger.debug('')
-        logger.debug('  topic {}'.format(received_data['story'].topic))
-        logger.debug('  step {} ({})'.format(received_data['step'], len(received_data['story'].story_line)))
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug('')
+            logger.debug('process_next_part_of_story')
+            logger.debug('')
+            logger.debug('  topic %s', received_data['story'].topic)
+            logger.debug('  step %s (%s)', received_data['step'], len(received_data['story'].story_line))
 
-        for m in self.middlewares:
-            if hasattr(m, 'process'):
-                received_data = m.process(received_data, validation_result)
+        for process in self.process_hooks:
+            received_data = process(received_data, validation_result)
 
-        logger.debug('  len(session.stack) = {}'.format(len(session['stack'])))
-        logger.debug('  session.stack = {}'.format(session['stack']))
-        logger.debug('  action: extend stack by +{}'.format(len(received_data['stack_tail'])))
+        if debug:
+            logger.debug('  session.stack %s', describe_stack(session['stack']))
+            logger.debug('  action: extend stack by +%s', len(received_data['stack_tail']))
 
         session['stack'].extend(received_data['stack_tail'])
         session['stack'][-1] = build_empty_stack_item()
 
-        logger.debug('  session.stack = {}'.format(session['stack']))
-        logger.debug('! after topic {}'.format(received_data['story'].topic))
-        logger.debug('! after step {}'.format(received_data['step']))
+        if debug:
+            logger.debug('  session.stack %s', describe_stack(session['stack']))
+            logger.debug('! after topic %s', received_data['story'].topic)
+            logger.debug('! after step %s', received_data['step'])
 
         # we shouldn't bubble up because we inside other story
         # that under control
@@ -246,12 +371,21 @@ class StoryProcessor:
         )
 
 
+class BubbleUp:
+    """
+    story is over so message should be matched
+    with the rest of the stack
+    """
+
+    def __init__(self):
+        pass
+
+
 def process_async_operation(compiled_story, current_stack_level, idx, processor, session, waiting_for):
     # should wait result of async operation
     # (for example answer from user)
-    for m in processor.middlewares:
-        if hasattr(m, 'process_validator'):
-            waiting_for = m.process_validator(processor, waiting_for, compiled_story)
+    for process_validator in processor.process_validator_hooks:
+        waiting_for = process_validator(processor, waiting_for, compiled_story)
 
     validator = matchers.get_validator(waiting_for)
 
@@ -266,9 +400,28 @@ def process_async_operation(compiled_story, current_stack_level, idx, processor,
     return waiting_for
 
 
+def get_session_key(session):
+    for field in ('user_id', 'facebook_user_id', '_id'):
+        value = session.get(field, None)
+        if value is not None:
+            return field, value
+    return 'id', id(session)
+
+
 def build_empty_stack_item():
     return {
         'data': None,
         'step': 0,
         'topic': None,
     }
+
+
+def describe_stack(stack):
+    """
+    short description of stack for debug log.
+    stack could be deep so we don't dump it whole on each step
+
+    :param stack:
+    :return:
+    """
+    return '({} frames) top: {}'.format(len(stack), stack[-1] if stack else None)
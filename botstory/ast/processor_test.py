@@ -0,0 +1,134 @@
+import asyncio
+import sys
+import pytest
+
+from . import callable, parser, processor
+from .. import matchers, Story
+from ..middlewares import text
+from ..utils import answer, build_fake_session, build_fake_user, SimpleTrigger
+
+story = None
+
+
+def teardown_function(function):
+    story and story.clear()
+
+
+@pytest.mark.asyncio
+async def test_process_messages_of_one_session_one_by_one():
+    user = build_fake_user()
+    session = build_fake_session(user)
+    other_user = build_fake_user()
+    other_session = build_fake_session(other_user)
+    log = []
+
+    global story
+    story = Story()
+
+    @story.on(text.Any())
+    def echo_story():
+        @story.part()
+        async def echo(message):
+            log.append('start {}'.format(message['data']['text']['raw']))
+            await asyncio.sleep(0.01)
+            log.append('end {}'.format(message['data']['text']['raw']))
+
+    await asyncio.gather(
+        answer.pure_text('first', session, user, story),
+        answer.pure_text('second', session, user, story),
+        answer.pure_text('other', other_session, other_user, story),
+    )
+
+    # gather doesn't guarantee which of them starts first
+    # so we only check that messages of one session don't interleave
+    assert log.index('end first') < log.index('start second') or \
+           log.index('end second') < log.index('start first')
+    # while other session doesn't wait for them
+    assert log.index('start other') < min(log.index('end first'), log.index('end second'))
+    assert len(story.story_processor_instance.session_lock) == 0
+
+
+def test_session_key_is_stable_for_the_same_user():
+    user = build_fake_user()
+    assert processor.get_session_key(build_fake_session(user)) == \
+           processor.get_session_key(build_fake_session(user))
+
+
+def test_compile_plan_of_story():
+    global story
+    story = Story()
+
+    @story.on('hi')
+    def one_story():
+        @story.part()
+        def sync_part(message):
+            pass
+
+        @story.part()
+        async def async_part(message):
+            pass
+
+        @story.case(default=True)
+        def default_case():
+            @story.part()
+            def inner_part(message):
+                pass
+
+    compiled_story = story.stories_library.get_story_by_topic('one_story')
+    assert [(step.name, step.kind) for step in compiled_story.plan] == [
+        ('sync_part', parser.SYNC),
+        ('async_part', parser.ASYNC),
+        ('StoryPartFork', parser.FORK),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_bubble_up_through_deep_stack_of_callable_stories():
+    # deeper than recursion limit so recursive unwinding would fail
+    depth = sys.getrecursionlimit() + 10
+    trigger = SimpleTrigger(0)
+
+    global story
+    story = Story()
+
+    @story.callable()
+    def nested_story():
+        @story.part()
+        def ask(message):
+            return text.Any()
+
+        @story.part()
+        def count(message):
+            trigger.receive(trigger.value + 1)
+
+    @story.on('hi')
+    def outer_story():
+        @story.part()
+        async def call_nested(message):
+            return await nested_story(session=message['session'])
+
+        @story.part()
+        def done(message):
+            trigger.passed()
+
+    user = build_fake_user()
+    session = build_fake_session(user)
+    session['stack'] = [{
+        'data': matchers.serialize(callable.WaitForReturn()),
+        'step': 1,
+        'topic': 'outer_story',
+    }] + [{
+        'data': matchers.serialize(callable.WaitForReturn()),
+        'step': 1,
+        'topic': 'nested_story',
+    } for _ in range(depth)] + [{
+        'data': matchers.serialize(text.Any()),
+        'step': 1,
+        'topic': 'nested_story',
+    }]
+
+    await answer.pure_text('hello', session, user, story)
+
+    assert trigger.value == depth + 1
+    assert trigger.is_triggered
+    assert session['stack'] == [{'data': None, 'step': 2, 'topic': 'outer_story'}]
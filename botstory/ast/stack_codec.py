@@ -0,0 +1,217 @@
+"""
+compact binary encoding of session stack
+
+layout (all integers are unsigned LEB128 varints):
+
+    b'bs' | version | number of strings | (length | utf-8)* | value of stack
+
+each string (topic, matcher type, key of dict) is stored once per stack
+and values refer to it by index in the table
+"""
+
+import logging
+import struct
+
+from .. import di
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'bs'
+VERSION = 1
+
+# tags of values
+NONE = 0
+FALSE = 1
+TRUE = 2
+INT = 3
+NEG_INT = 4
+FLOAT = 5
+STR = 6
+LIST = 7
+DICT = 8
+BYTES = 9
+
+FLOAT_FORMAT = struct.Struct('<d')
+
+
+def is_encoded(stack):
+    return isinstance(stack, (bytes, bytearray))
+
+
+def decode_stack(stack):
+    """
+    get stack as list of frames whether it was encoded or not
+
+    :param stack:
+    :return:
+    """
+    if is_encoded(stack):
+        return decode(stack)
+    return stack
+
+
+def encode(stack):
+    encoder = Encoder()
+    encoder.write_value(stack)
+    return encoder.get_bytes()
+
+
+def decode(blob):
+    return Decoder(blob).read_stack()
+
+
+def write_varint(buf, value):
+    while value > 0x7f:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+class Encoder:
+    def __init__(self):
+        self.strings = {}
+        self.body = bytearray()
+
+    def intern(self, value):
+        idx = self.strings.get(value, None)
+        if idx is None:
+            idx = self.strings[value] = len(self.strings)
+        return idx
+
+    def write_value(self, value):
+        body = self.body
+        if value is None:
+            body.append(NONE)
+        elif value is True:
+            body.append(TRUE)
+        elif value is False:
+            body.append(FALSE)
+        elif isinstance(value, int):
+            if value >= 0:
+                body.append(INT)
+                write_varint(body, value)
+            else:
+                body.append(NEG_INT)
+                write_varint(body, -value)
+        elif isinstance(value, float):
+            body.append(FLOAT)
+            body.extend(FLOAT_FORMAT.pack(value))
+        elif isinstance(value, str):
+            body.append(STR)
+            write_varint(body, self.intern(value))
+        elif isinstance(value, (bytes, bytearray)):
+            body.append(BYTES)
+            write_varint(body, len(value))
+            body.extend(value)
+        elif isinstance(value, (list, tuple)):
+            body.append(LIST)
+            write_varint(body, len(value))
+            for item in value:
+                self.write_value(item)
+        elif isinstance(value, dict):
+            body.append(DICT)
+            write_varint(body, len(value))
+            for key, item in value.items():
+                if not isinstance(key, str):
+                    raise TypeError('key of dict should be string but got {}'.format(key))
+                write_varint(body, self.intern(key))
+                self.write_value(item)
+        else:
+            raise TypeError('can not encode {} of stack'.format(type(value)))
+
+    def get_bytes(self):
+        res = bytearray(MAGIC)
+        res.append(VERSION)
+        write_varint(res, len(self.strings))
+        for value in self.strings:
+            encoded = value.encode('utf-8')
+            write_varint(res, len(encoded))
+            res.extend(encoded)
+        res.extend(self.body)
+        return bytes(res)
+
+
+class Decoder:
+    def __init__(self, blob):
+        self.blob = blob
+        self.pos = 0
+        self.strings = []
+
+    def read_varint(self):
+        res = 0
+        shift = 0
+        while True:
+            byte = self.blob[self.pos]
+            self.pos += 1
+            res |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return res
+            shift += 7
+
+    def read_bytes(self, length):
+        res = self.blob[self.pos:self.pos + length]
+        self.pos += length
+        return bytes(res)
+
+    def read_stack(self):
+        if self.blob[:len(MAGIC)] != MAGIC:
+            raise ValueError('stack is not encoded')
+        self.pos = len(MAGIC)
+        version = self.blob[self.pos]
+        self.pos += 1
+        if version != VERSION:
+            raise ValueError('unsupported version {} of stack encoding'.format(version))
+
+        self.strings = [self.read_bytes(self.read_varint()).decode('utf-8')
+                        for _ in range(self.read_varint())]
+        return self.read_value()
+
+    def read_value(self):
+        tag = self.blob[self.pos]
+        self.pos += 1
+        if tag == NONE:
+            return None
+        if tag == TRUE:
+            return True
+        if tag == FALSE:
+            return False
+        if tag == INT:
+            return self.read_varint()
+        if tag == NEG_INT:
+            return -self.read_varint()
+        if tag == FLOAT:
+            value, = FLOAT_FORMAT.unpack_from(self.blob, self.pos)
+            self.pos += FLOAT_FORMAT.size
+            return value
+        if tag == STR:
+            return self.strings[self.read_varint()]
+        if tag == BYTES:
+            return self.read_bytes(self.read_varint())
+        if tag == LIST:
+            return [self.read_value() for _ in range(self.read_varint())]
+        if tag == DICT:
+            res = {}
+            for _ in range(self.read_varint()):
+                key = self.strings[self.read_varint()]
+                res[key] = self.read_value()
+            return res
+        raise ValueError('unknown tag {} of stack encoding'.format(tag))
+
+
+@di.desc(reg=False)
+class StackCodec:
+    """
+    store session stack in compact binary form.
+    processor decodes stack transparently whether codec is used or not:
+
+        story.use(StackCodec())
+    """
+
+    def encode_stack(self, stack):
+        if is_encoded(stack):
+            return stack
+        try:
+            return encode(stack)
+        except TypeError as err:
+            logger.warning('keep stack as it is because of: {}'.format(err))
+            return stack
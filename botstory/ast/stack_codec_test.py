@@ -0,0 +1,88 @@
+import pytest
+
+from . import callable, stack_codec
+from .. import matchers, Story
+from ..middlewares import text
+from ..utils import answer, build_fake_session, build_fake_user
+
+story = None
+
+
+def teardown_function(function):
+    story and story.clear()
+
+
+def build_stack():
+    return [{
+        'data': matchers.serialize(callable.WaitForReturn()),
+        'step': 1,
+        'topic': 'one_story',
+    }, {
+        'type': 'Match',
+        'data': matchers.serialize(text.Match('hi')),
+        'step': 12345,
+        'topic': 'one_story',
+    }, {
+        'data': None,
+        'step': 0,
+        'topic': None,
+        'extra': [-1, 0.5, True, False, b'\x00'],
+    }]
+
+
+def test_encode_and_decode_stack():
+    stack = build_stack()
+    blob = stack_codec.encode(stack)
+
+    assert stack_codec.is_encoded(blob)
+    assert blob[:3] == b'bs\x01'
+    assert stack_codec.decode(blob) == stack
+    assert len(blob) < len(str(stack))
+
+
+def test_decode_plain_stack_as_it_is():
+    stack = build_stack()
+    assert stack_codec.decode_stack(stack) is stack
+
+
+def test_fail_on_unknown_version():
+    blob = bytearray(stack_codec.encode([]))
+    blob[2] = 99
+    with pytest.raises(ValueError):
+        stack_codec.decode(bytes(blob))
+
+
+def test_keep_stack_which_can_not_be_encoded():
+    stack = [{'data': object()}]
+    assert stack_codec.StackCodec().encode_stack(stack) is stack
+
+
+@pytest.mark.asyncio
+async def test_processor_decodes_and_encodes_stack():
+    trigger = []
+
+    global story
+    story = Story()
+    story.use(stack_codec.StackCodec())
+
+    @story.on('hi')
+    def one_story():
+        @story.part()
+        def ask(message):
+            return text.Any()
+
+        @story.part()
+        def receive(message):
+            trigger.append(message['data']['text']['raw'])
+
+    await story.start()
+
+    user = build_fake_user()
+    session = build_fake_session(user)
+
+    await answer.pure_text('hi', session, user, story)
+    assert stack_codec.is_encoded(session['stack'])
+
+    await answer.pure_text('there', session, user, story)
+    assert trigger == ['there']
+    assert stack_codec.decode(session['stack']) == [{'data': None, 'step': 2, 'topic': 'one_story'}]
@@ -0,0 +1,75 @@
+import collections
+import logging
+import time
+
+from .. import di
+
+logger = logging.getLogger(__name__)
+
+# fields of user which could be used to enable tracing
+USER_ID_FIELDS = ('_id', 'facebook_user_id')
+
+
+def copy_stack(stack):
+    return [dict(item) for item in stack]
+
+
+def get_user_ids(user):
+    for field in USER_ID_FIELDS:
+        try:
+            value = user[field]
+        except (KeyError, TypeError):
+            continue
+        if value is not None:
+            yield value
+
+
+@di.desc(reg=False)
+class TraceRecorder:
+    """
+    structured trace of story processing for chosen users.
+
+    processor asks recorder only once it has been registered
+    so tracing doesn't cost anything until we use it:
+
+        recorder = story.use(TraceRecorder(user_ids=['<facebook_user_id>']))
+        ...
+        recorder.get_records('<facebook_user_id>')
+    """
+
+    def __init__(self, user_ids=None, max_records=1000):
+        """
+
+        :param user_ids: ids (`_id` or `facebook_user_id`) of traced users
+        :param max_records: how many last records we should keep
+        """
+        self.user_ids = set(user_ids or [])
+        self.records = collections.deque(maxlen=max_records)
+
+    def enable(self, user_id):
+        logger.debug('enable tracing of %s', user_id)
+        self.user_ids.add(user_id)
+
+    def disable(self, user_id):
+        logger.debug('disable tracing of %s', user_id)
+        self.user_ids.discard(user_id)
+
+    def is_traced(self, user):
+        if not self.user_ids or not user:
+            return False
+        return any(user_id in self.user_ids for user_id in get_user_ids(user))
+
+    def record(self, user, event, **fields):
+        self.records.append({
+            'time': time.time(),
+            'user_ids': list(get_user_ids(user)),
+            'event': event,
+            **fields,
+        })
+
+    def get_records(self, user_id=None):
+        return [r for r in self.records
+                if user_id is None or user_id in r['user_ids']]
+
+    def clear(self):
+        self.records.clear()
@@ -0,0 +1,73 @@
+import pytest
+
+from . import trace
+from .. import Story
+from ..utils import answer, build_fake_session, build_fake_user
+
+story = None
+
+
+def teardown_function(function):
+    story and story.clear()
+
+
+def test_trace_only_chosen_users():
+    user = build_fake_user()
+    recorder = trace.TraceRecorder(user_ids=[user['facebook_user_id']])
+
+    assert recorder.is_traced(user)
+    assert not recorder.is_traced(build_fake_user())
+    assert not recorder.is_traced(None)
+
+    recorder.disable(user['facebook_user_id'])
+    assert not recorder.is_traced(user)
+
+    recorder.enable(user['_id'])
+    assert recorder.is_traced(user)
+
+
+def test_keep_limited_number_of_records():
+    user = build_fake_user()
+    recorder = trace.TraceRecorder(max_records=2)
+
+    for idx in range(3):
+        recorder.record(user, 'event', idx=idx)
+
+    assert [r['idx'] for r in recorder.get_records(user['_id'])] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_record_processing_of_traced_user():
+    session = build_fake_session()
+    user = build_fake_user()
+    other_session = build_fake_session()
+    other_user = build_fake_user()
+
+    global story
+    story = Story()
+
+    @story.on('hi there!')
+    def one_story():
+        @story.part()
+        async def greeting(message):
+            return await story.ask('How are you?', user=message['user'])
+
+        @story.part()
+        def store(message):
+            pass
+
+    recorder = story.use(trace.TraceRecorder(user_ids=[user['_id']]))
+    await story.start()
+
+    await answer.pure_text('hi there!', session, user, story)
+    await answer.pure_text('hi there!', other_session, other_user, story)
+    await answer.pure_text('Great!', session, user, story)
+
+    records = recorder.get_records()
+    assert all(user['_id'] in r['user_ids'] for r in records)
+    assert [(r['event'], r.get('part')) for r in records if r['event'] in ['match_message', 'story_part']] == [
+        ('match_message', None),
+        ('story_part', 'greeting'),
+        ('match_message', None),
+        ('story_part', 'store'),
+    ]
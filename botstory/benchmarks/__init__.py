@@ -0,0 +1 @@
+from .pipeline import Config, run
@@ -0,0 +1,95 @@
+"""
+python -m botstory.benchmarks --mode fb --conversations 1000 --concurrency 50
+python -m botstory.benchmarks --mode send --messages 10000 --latency 0.05 --rate-limit-rate 0.01
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import sys
+
+from . import pipeline
+
+SEND_MODE = 'send'
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='benchmark of bot-story message pipeline')
+    parser.add_argument('--mode', choices=pipeline.MODES + (SEND_MODE,), default='story')
+    parser.add_argument('--handlers', type=int, default=10)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--fan-out', type=int, default=2)
+    parser.add_argument('--callable-nesting', type=int, default=1)
+    parser.add_argument('--conversations', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--trace-memory', action='store_true')
+    # options of send mode
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--recipients', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--latency-jitter', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--send-rate', type=float)
+    parser.add_argument('--recipient-rate', type=float)
+    parser.add_argument('--send-retries', type=int, default=5)
+    parser.add_argument('--connection-limit', type=int, default=100)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--output', help='store report to file instead of stdout')
+    return parser.parse_args(args)
+
+
+def build_send_benchmark(options):
+    # fake server depends on aiohttp so we import it only once we need it
+    from . import send
+    return send.run(send.Config(
+        messages=options.messages,
+        concurrency=options.concurrency,
+        recipients=options.recipients,
+        latency=options.latency,
+        latency_jitter=options.latency_jitter,
+        error_rate=options.error_rate,
+        rate_limit_rate=options.rate_limit_rate,
+        retry_after=options.retry_after,
+        send_rate=options.send_rate,
+        recipient_rate=options.recipient_rate,
+        send_retries=options.send_retries,
+        connection_limit=options.connection_limit,
+        seed=options.seed,
+    ))
+
+
+def build_pipeline_benchmark(options):
+    return pipeline.run(pipeline.Config(
+        mode=options.mode,
+        handlers=options.handlers,
+        depth=options.depth,
+        fan_out=options.fan_out,
+        callable_nesting=options.callable_nesting,
+        conversations=options.conversations,
+        concurrency=options.concurrency,
+        trace_memory=options.trace_memory,
+    ))
+
+
+def main(args=None):
+    options = parse_args(args)
+    if options.mode == SEND_MODE:
+        benchmark = build_send_benchmark(options)
+    else:
+        benchmark = build_pipeline_benchmark(options)
+    loop = asyncio.get_event_loop()
+    # keep stdout for the report only (di prints registration of instances)
+    with contextlib.redirect_stdout(sys.stderr):
+        report = json.dumps(loop.run_until_complete(benchmark), indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+"""
+throughput and latency of the message pipeline
+
+messages go through `Story.match_message` (mode 'story')
+or through `FBInterface.handle` (mode 'fb') with in-memory storage
+and mocked http so we measure only the framework itself
+"""
+
+import asyncio
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+import zlib
+
+from .. import di, Story, utils
+from ..ast import forking
+from ..integrations import fb, mockdb, mockhttp
+from ..middlewares import text
+from ..utils import answer
+
+logger = logging.getLogger(__name__)
+
+MODES = ('story', 'fb')
+
+
+class Config:
+    def __init__(self,
+                 mode='story',
+                 handlers=10,
+                 depth=3,
+                 fan_out=2,
+                 callable_nesting=1,
+                 conversations=100,
+                 concurrency=10,
+                 trace_memory=False,
+                 ):
+        """
+
+        :param mode: 'story' (Story.match_message) or 'fb' (FBInterface.handle)
+        :param handlers: number of top level stories
+        :param depth: number of questions in each story
+        :param fan_out: number of cases of fork in each story (0 - without fork)
+        :param callable_nesting: depth of chain of callable stories in each case
+        :param conversations: number of simulated conversations
+        :param concurrency: number of simultaneous conversations
+        :param trace_memory: measure memory with tracemalloc (slows down pipeline)
+        """
+        if mode not in MODES:
+            raise ValueError('mode should be one of {}'.format(MODES))
+        self.mode = mode
+        self.handlers = handlers
+        self.depth = depth
+        self.fan_out = fan_out
+        self.callable_nesting = callable_nesting
+        self.conversations = conversations
+        self.concurrency = concurrency
+        self.trace_memory = trace_memory
+
+    def to_json(self):
+        return dict(self.__dict__)
+
+
+@di.desc('storage', reg=False)
+class MemoryDB(mockdb.MockDB):
+    """
+    MockDB keeps only one user and session
+    so conversations of simulated users need their own storage
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.users = {}
+        self.sessions = {}
+
+    async def get_session(self, facebook_user_id=None, **kwargs):
+        return self.sessions.get(facebook_user_id, None)
+
+    async def set_session(self, session):
+        self.sessions[session['facebook_user_id']] = session
+
+    async def new_session(self, user, **kwargs):
+        session = {**kwargs, 'user_id': user['_id']}
+        self.sessions[session['facebook_user_id']] = session
+        return session
+
+    async def get_user(self, facebook_user_id=None, **kwargs):
+        return self.users.get(facebook_user_id, None)
+
+    async def set_user(self, user):
+        self.users[user['facebook_user_id']] = user
+
+    async def new_user(self, **kwargs):
+        user = utils.JSDict({'_id': utils.uniq_id(), **kwargs})
+        self.users[user['facebook_user_id']] = user
+        return user
+
+
+def named(fn, name):
+    # parts of one story should have unique names
+    fn.__name__ = name
+    return fn
+
+
+def build_callable_chain(story, nesting):
+    """
+    chain of callable stories where each one calls the next
+    and the last one waits for answer of user
+
+    :return: startpoint of the first story in chain or None
+    """
+    next_story = None
+    for level in reversed(range(nesting)):
+        def callable_story(next_story=next_story, level=level):
+            @story.part()
+            async def enter(user, session):
+                if next_story:
+                    # startpoint takes session from keywords so we pass it twice
+                    return await next_story(user, session, session=session)
+                return await story.ask('callable {}'.format(level), user=user)
+
+            @story.part()
+            def leave(message):
+                pass
+
+        next_story = story.callable()(named(callable_story, 'callable_{}'.format(level)))
+    return next_story
+
+
+def build_story(config, stats):
+    """
+    synthetic library of stories
+
+    :param config:
+    :param stats: counters of finished conversations
+    :return:
+    """
+    story = Story()
+    chain = build_callable_chain(story, config.callable_nesting)
+
+    for handler_idx in range(config.handlers):
+        def handler_story(handler_idx=handler_idx):
+            for step in range(config.depth):
+                async def ask(message, step=step):
+                    return await story.ask('question {}'.format(step), user=message['user'])
+
+                story.part()(named(ask, 'ask_{}'.format(step)))
+
+            if config.fan_out:
+                @story.part()
+                def fork(message):
+                    facebook_user_id = message['user']['facebook_user_id']
+                    return forking.SwitchOnValue(zlib.crc32(facebook_user_id.encode('utf-8')) % config.fan_out)
+
+                for case_idx in range(config.fan_out):
+                    def case_story():
+                        @story.part()
+                        async def enter_case(message):
+                            if chain:
+                                return await chain(message['user'], message['session'],
+                                                   session=message['session'])
+
+                    story.case(equal_to=case_idx)(named(case_story, 'case_{}'.format(case_idx)))
+
+            @story.part()
+            async def done(message):
+                stats['completed'] += 1
+                await story.say('bye', user=message['user'])
+
+        story.on(text.Match('start {}'.format(handler_idx)))(
+            named(handler_story, 'story_{}'.format(handler_idx)))
+
+    return story
+
+
+def build_script(config, conversation_idx):
+    """
+    messages of one conversation
+    """
+    answers = config.depth
+    if config.fan_out and config.callable_nesting:
+        answers += 1
+    return ['start {}'.format(conversation_idx % config.handlers)] + \
+           ['answer {}'.format(idx) for idx in range(answers)]
+
+
+def build_messaging(facebook_user_id, raw_text):
+    return {
+        'object': 'page',
+        'entry': [{
+            'id': 'PAGE_ID',
+            'time': 1473204787206,
+            'messaging': [{
+                'sender': {'id': facebook_user_id},
+                'recipient': {'id': 'PAGE_ID'},
+                'timestamp': 1458692752478,
+                'message': {'text': raw_text},
+            }],
+        }],
+    }
+
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    idx = min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100))
+    return sorted_values[idx]
+
+
+async def run(config):
+    """
+    drive simulated conversations and measure pipeline
+
+    :param config:
+    :return: machine-readable report
+    """
+    stats = {'completed': 0}
+    story = build_story(config, stats)
+    interface = story.use(fb.FBInterface(page_access_token='benchmark'))
+    story.use(mockhttp.MockHttpInterface())
+    story.use(MemoryDB())
+    await story.start()
+
+    latencies = []
+    semaphore = asyncio.Semaphore(config.concurrency)
+
+    async def send(user, session, raw_text):
+        if config.mode == 'fb':
+            await interface.handle(build_messaging(user['facebook_user_id'], raw_text))
+        else:
+            await answer.pure_text(raw_text, session, user, story)
+
+    async def converse(conversation_idx):
+        async with semaphore:
+            user = {
+                '_id': conversation_idx,
+                'facebook_user_id': 'user_{}'.format(conversation_idx),
+            }
+            session = utils.build_fake_session(user)
+            for raw_text in build_script(config, conversation_idx):
+                started_at = time.perf_counter()
+                await send(user, session, raw_text)
+                latencies.append(time.perf_counter() - started_at)
+
+    if config.trace_memory:
+        tracemalloc.start()
+    blocks_before = sys.getallocatedblocks()
+    started_at = time.perf_counter()
+    try:
+        await asyncio.gather(*[converse(idx) for idx in range(config.conversations)])
+        seconds = time.perf_counter() - started_at
+        blocks_after = sys.getallocatedblocks()
+        memory = {
+            'net_blocks_per_message': (blocks_after - blocks_before) / max(len(latencies), 1),
+        }
+        if config.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            memory['traced_bytes_per_message'] = current / max(len(latencies), 1)
+            memory['peak_traced_bytes'] = peak
+    finally:
+        if config.trace_memory:
+            tracemalloc.stop()
+        await story.stop()
+        story.clear()
+
+    latencies.sort()
+    return {
+        'benchmark': 'pipeline',
+        'config': config.to_json(),
+        'python': platform.python_version(),
+        'messages': len(latencies),
+        'completed_conversations': stats['completed'],
+        'seconds': seconds,
+        'messages_per_second': len(latencies) / seconds if seconds else None,
+        'latency_ms': {
+            'p50': percentile(latencies, 50) * 1000 if latencies else None,
+            'p90': percentile(latencies, 90) * 1000 if latencies else None,
+            'p99': percentile(latencies, 99) * 1000 if latencies else None,
+            'max': latencies[-1] * 1000 if latencies else None,
+        },
+        'memory': memory,
+    }
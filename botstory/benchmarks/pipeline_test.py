@@ -0,0 +1,45 @@
+import json
+import pytest
+
+from . import pipeline, __main__
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('mode', pipeline.MODES)
+async def test_drive_all_conversations_to_the_end(mode):
+    report = await pipeline.run(pipeline.Config(
+        mode=mode,
+        handlers=3,
+        depth=2,
+        fan_out=2,
+        callable_nesting=2,
+        conversations=10,
+        concurrency=4,
+    ))
+
+    assert report['completed_conversations'] == 10
+    assert report['messages'] == 10 * 4
+    assert report['latency_ms']['p50'] <= report['latency_ms']['p99'] <= report['latency_ms']['max']
+    assert json.loads(json.dumps(report)) == report
+
+
+def test_percentile():
+    values = list(range(100))
+    assert pipeline.percentile(values, 50) == 50
+    assert pipeline.percentile(values, 99) == 99
+    assert pipeline.percentile([], 99) is None
+
+
+def test_parse_args():
+    options = __main__.parse_args(['--mode', 'fb', '--fan-out', '0'])
+    assert options.mode == 'fb'
+    assert options.fan_out == 0
+    assert options.conversations == 100
+
+
+def test_parse_args_of_send_mode():
+    options = __main__.parse_args(['--mode', 'send', '--latency', '0.05', '--rate-limit-rate', '0.01'])
+    assert options.mode == 'send'
+    assert options.latency == 0.05
+    assert options.rate_limit_rate == 0.01
+    assert options.messages == 1000
@@ -0,0 +1,154 @@
+"""
+throughput and latency of outgoing messages
+
+messages go through `FBInterface.send_text_message` and `AioHttpInterface`
+to local fake Graph API so we measure the whole send path
+including pool of connections
+"""
+
+import asyncio
+import logging
+import platform
+import time
+
+from .pipeline import percentile
+from .. import Story
+from ..integrations import aiohttp, fb
+from ..integrations.commonhttp import errors as commonhttp_errors
+from ..integrations.tests import fake_server
+
+logger = logging.getLogger(__name__)
+
+
+class Config:
+    def __init__(self,
+                 messages=1000,
+                 concurrency=50,
+                 recipients=100,
+                 latency=0,
+                 latency_jitter=0,
+                 error_rate=0,
+                 rate_limit_rate=0,
+                 retry_after=1,
+                 send_rate=None,
+                 recipient_rate=None,
+                 send_retries=5,
+                 connection_limit=100,
+                 keepalive_timeout=30,
+                 seed=None,
+                 ):
+        """
+
+        :param messages: number of sent messages
+        :param concurrency: number of simultaneous sends
+        :param recipients: number of distinct recipients
+        :param latency: delay (in seconds) of fake server
+        :param latency_jitter: max random deviation of latency
+        :param error_rate: share (0..1) of requests which fail with 500
+        :param rate_limit_rate: share (0..1) of requests which fail with 429
+        :param retry_after: value of Retry-After header of 429 responses
+        :param send_rate: max number of requests per second (None - unlimited)
+        :param recipient_rate: max number of messages to one user per second (None - unlimited)
+        :param send_retries: how many times we retry throttled or failed request
+        :param connection_limit: max number of simultaneous outgoing connections
+        :param keepalive_timeout: how long (in seconds) we keep idle connection open
+        :param seed: seed of random of fake server
+        """
+        self.messages = messages
+        self.concurrency = concurrency
+        self.recipients = recipients
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.send_rate = send_rate
+        self.recipient_rate = recipient_rate
+        self.send_retries = send_retries
+        self.connection_limit = connection_limit
+        self.keepalive_timeout = keepalive_timeout
+        self.seed = seed
+
+    def to_json(self):
+        return dict(self.__dict__)
+
+
+async def run(config, loop=None):
+    """
+    send messages to fake Graph API and measure send path
+
+    :param config:
+    :param loop:
+    :return: machine-readable report
+    """
+    loop = loop or asyncio.get_event_loop()
+    stats = {'sent': 0, 'failed': 0}
+    latencies = []
+
+    async with fake_server.FakeGraphAPI(loop,
+                                        latency=config.latency,
+                                        latency_jitter=config.latency_jitter,
+                                        error_rate=config.error_rate,
+                                        rate_limit_rate=config.rate_limit_rate,
+                                        retry_after=config.retry_after,
+                                        seed=config.seed,
+                                        ) as server:
+        story = Story()
+        interface = story.use(fb.FBInterface(
+            page_access_token='benchmark',
+            send_rate=config.send_rate,
+            recipient_rate=config.recipient_rate,
+            send_retries=config.send_retries,
+        ))
+        story.use(aiohttp.AioHttpInterface(
+            auto_start=False,
+            connection_limit=config.connection_limit,
+            keepalive_timeout=config.keepalive_timeout,
+            resolver=server.resolver,
+            verify_ssl=False,
+        ))
+        await story.start()
+
+        semaphore = asyncio.Semaphore(config.concurrency)
+
+        async def send(idx):
+            recipient = {'facebook_user_id': 'user_{}'.format(idx % config.recipients)}
+            async with semaphore:
+                started_at = time.perf_counter()
+                try:
+                    await interface.send_text_message(recipient, 'message {}'.format(idx))
+                    stats['sent'] += 1
+                except commonhttp_errors.HttpRequestError:
+                    stats['failed'] += 1
+                latencies.append(time.perf_counter() - started_at)
+
+        started_at = time.perf_counter()
+        try:
+            await asyncio.gather(*[send(idx) for idx in range(config.messages)])
+            seconds = time.perf_counter() - started_at
+        finally:
+            await story.stop()
+            story.clear()
+
+        server_metrics = server.get_metrics()
+        send_metrics = interface.get_send_metrics()
+
+    latencies.sort()
+    return {
+        'benchmark': 'send',
+        'config': config.to_json(),
+        'python': platform.python_version(),
+        'messages': len(latencies),
+        'sent': stats['sent'],
+        'failed': stats['failed'],
+        'seconds': seconds,
+        'messages_per_second': stats['sent'] / seconds if seconds else None,
+        'latency_ms': {
+            'p50': percentile(latencies, 50) * 1000 if latencies else None,
+            'p90': percentile(latencies, 90) * 1000 if latencies else None,
+            'p99': percentile(latencies, 99) * 1000 if latencies else None,
+            'max': latencies[-1] * 1000 if latencies else None,
+        },
+        'interface': send_metrics,
+        'server': server_metrics,
+    }
@@ -0,0 +1,56 @@
+import json
+import pytest
+
+from . import send
+
+
+@pytest.mark.asyncio
+async def test_send_all_messages_through_pool_of_connections(event_loop):
+    report = await send.run(send.Config(
+        messages=50,
+        concurrency=5,
+        recipients=10,
+        connection_limit=5,
+    ), loop=event_loop)
+
+    assert report['sent'] == 50
+    assert report['failed'] == 0
+    assert report['server']['statuses'] == {'200': 50}
+    assert report['server']['connections'] <= 5
+    assert report['latency_ms']['p50'] <= report['latency_ms']['p99'] <= report['latency_ms']['max']
+    assert json.loads(json.dumps(report)) == report
+
+
+@pytest.mark.asyncio
+async def test_retry_rate_limited_and_failed_messages(event_loop):
+    report = await send.run(send.Config(
+        messages=100,
+        concurrency=10,
+        error_rate=0.2,
+        rate_limit_rate=0.2,
+        retry_after=0,
+        send_retries=10,
+        seed=1,
+    ), loop=event_loop)
+
+    statuses = report['server']['statuses']
+    assert report['sent'] == statuses['200'] == 100
+    assert report['failed'] == 0
+    assert report['interface']['retries'] == statuses['429'] + statuses['500']
+
+
+@pytest.mark.asyncio
+async def test_count_failed_messages_without_retries(event_loop):
+    report = await send.run(send.Config(
+        messages=100,
+        concurrency=10,
+        error_rate=0.2,
+        rate_limit_rate=0.2,
+        send_retries=0,
+        seed=1,
+    ), loop=event_loop)
+
+    statuses = report['server']['statuses']
+    assert report['sent'] == statuses['200']
+    assert report['failed'] == statuses['429'] + statuses['500']
+    assert report['sent'] + report['failed'] == 100
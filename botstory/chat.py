@@ -1,14 +1,25 @@
 import asyncio
 import logging
+import time
 
+from . import di
 from .middlewares import any, location, text
+from .utils import broadcast
 
 logger = logging.getLogger(__name__)
 
 
+@di.desc(reg=False)
 class Chat:
     def __init__(self):
         self.interfaces = {}
+        self.metrics = None
+
+    @di.inject()
+    def add_metrics(self, metrics):
+        logger.debug('add_metrics')
+        logger.debug(metrics)
+        self.metrics = metrics
 
     async def ask(self, body, options=None, user=None):
         """
@@ -47,6 +58,32 @@ class Chat:
         return await self.send_text_message_to_all_interfaces(
             recipient=user, text=body)
 
+    async def broadcast(self, body, users, options=None,
+                        concurrency=100, on_progress=None, progress_interval=1000):
+        """
+        say something to many users.
+        users are streamed so audience isn't loaded in memory
+
+        :param body:
+        :param users: iterable or async iterable of users
+        (for example storage.iter_users())
+        :param options: (optional) quick replies
+        :param concurrency: max number of simultaneous sends
+        :param on_progress: (optional) function which receives report
+        once in progress_interval users
+        :param progress_interval:
+        :return: report with number of sent and failed messages
+        """
+
+        async def send(user):
+            await self.send_text_message_to_all_interfaces(
+                recipient=user, text=body, options=options)
+
+        return await broadcast.Broadcast(send,
+                                         concurrency=concurrency,
+                                         on_progress=on_progress,
+                                         progress_interval=progress_interval).run(users)
+
     async def send_text_message_to_all_interfaces(self, *args, **kwargs):
         """
         TODO:
@@ -64,7 +101,17 @@ class Chat:
         logger.debug('  tasks')
         logger.debug(tasks)
 
-        res = [body for body in await asyncio.gather(*tasks)]
+        metrics = self.metrics
+        if metrics:
+            started_at = time.perf_counter()
+        try:
+            res = [body for body in await asyncio.gather(*tasks)]
+        except Exception:
+            if metrics:
+                metrics.increment('send_errors')
+            raise
+        if metrics:
+            metrics.observe('stage_seconds', time.perf_counter() - started_at, stage='send')
         logger.debug('  res')
         logger.debug(res)
         return res
@@ -97,3 +97,22 @@ async def test_get_location_as_result_of_asking_of_location(mock_interface):
     await answer.location('somewhere', session, user, story)
 
     assert trigger.result() == 'somewhere'
+
+
+@pytest.mark.asyncio
+async def test_should_broadcast(mock_interface):
+    users = [build_fake_user() for _ in range(3)]
+
+    global story
+    story = Story()
+    story.use(mock_interface)
+
+    report = await story.broadcast('Happy New Year!', users, concurrency=2)
+
+    assert report['sent'] == 3
+    assert mock_interface.send_text_message.call_count == 3
+    mock_interface.send_text_message.assert_any_call(
+        recipient=users[1],
+        text='Happy New Year!',
+        options=None,
+    )
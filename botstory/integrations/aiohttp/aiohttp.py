@@ -1,6 +1,7 @@
 import aiohttp
 from aiohttp import errors, web
 import asyncio
+import inspect
 import logging
 import json as _json
 import urllib
@@ -8,16 +9,35 @@ from yarl import URL
 
 from ..commonhttp import errors as common_errors, statuses
 from ... import di
+from ...utils import queue
 
 logger = logging.getLogger(__name__)
 
 
 class WebhookHandler:
-    def __init__(self, handler):
+    def __init__(self, handler, work_queue=None):
+        """
+
+        :param handler:
+        :param work_queue: (optional) once we have queue we respond immediately
+        and leave processing to its workers
+        """
         self.handler = handler
+        self.work_queue = work_queue
 
     async def handle(self, request):
-        res = await self.handler(await request.json())
+        try:
+            data = await request.json()
+        except ValueError as err:
+            logger.warning('got invalid webhook payload {}'.format(err))
+            return web.Response(text='Invalid payload',
+                                status=statuses.HTTP_400_BAD_REQUEST)
+
+        if self.work_queue:
+            await self.work_queue.put(data)
+            return web.Response(text='Ok!')
+
+        res = await self.handler(data)
         return web.Response(**res)
 
 
@@ -35,7 +55,37 @@ class AioHttpInterface:
                  shutdown_timeout=60.0, ssl_context=None,
                  backlog=128, auto_start=True,
                  middlewares=[],
+                 connection_limit=100,
+                 connection_limit_per_host=None,
+                 keepalive_timeout=30,
+                 use_dns_cache=True,
+                 resolver=None,
+                 verify_ssl=True,
+                 webhook_workers=0,
+                 webhook_queue_size=100,
                  ):
+        """
+
+        :param host:
+        :param port:
+        :param shutdown_timeout:
+        :param ssl_context:
+        :param backlog:
+        :param auto_start:
+        :param middlewares:
+        :param connection_limit: max number of simultaneous outgoing connections
+        :param connection_limit_per_host: max number of simultaneous
+        outgoing connections to one host (requires aiohttp>=2.0)
+        :param keepalive_timeout: how long (in seconds) we keep idle connection open
+        :param use_dns_cache: cache resolved host names
+        :param resolver: (optional) custom resolver of host names
+        (for example to route requests to local fake server)
+        :param verify_ssl: check ssl certificates of remote hosts
+        :param webhook_workers: once we have workers webhook respond immediately
+        and payload is processed in background by workers
+        :param webhook_queue_size: max number of waiting webhook payloads.
+        once queue is full webhook waits for free slot
+        """
         if port is None:
             if not ssl_context:
                 port = 8080
@@ -51,94 +101,137 @@ class AioHttpInterface:
         self.ssl_context = ssl_context
         self.auto_start = auto_start
 
+        self.connection_limit = connection_limit
+        self.connection_limit_per_host = connection_limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.use_dns_cache = use_dns_cache
+        self.resolver = resolver
+        self.verify_ssl = verify_ssl
+
+        self.webhook_workers = webhook_workers
+        self.webhook_queue_size = webhook_queue_size
+        # uri -> queue of webhook payloads
+        self.webhook_queues = {}
+
         self.app = None
+        # long-lived client session with pool of connections
+        self.client_session = None
+        # be able to mock session from outside
         self.session = None
         self.server = None
         self.handler = None
         self.webhook_token = None
 
+    def build_connector(self):
+        options = {
+            'limit': self.connection_limit,
+            'keepalive_timeout': self.keepalive_timeout,
+            'use_dns_cache': self.use_dns_cache,
+            'verify_ssl': self.verify_ssl,
+        }
+        if self.connection_limit_per_host is not None:
+            options['limit_per_host'] = self.connection_limit_per_host
+        if self.resolver is not None:
+            options['resolver'] = self.resolver
+        return aiohttp.TCPConnector(loop=asyncio.get_event_loop(), **options)
+
+    def get_client_session(self):
+        """
+        get long-lived client session
+        so we don't need to open new connection for each request
+
+        :return:
+        """
+        if self.session:
+            return self.session
+        if not self.client_session or self.client_session.closed:
+            logger.debug('create client session')
+            self.client_session = aiohttp.ClientSession(
+                connector=self.build_connector(),
+                loop=asyncio.get_event_loop(),
+            )
+        return self.client_session
+
+    async def close_client_session(self):
+        if not self.client_session:
+            return
+        logger.debug('close client session')
+        closing = self.client_session.close()
+        # since aiohttp 2.0 close is coroutine
+        if inspect.isawaitable(closing):
+            await closing
+        self.client_session = None
+
     async def get(self, url, params=None, headers=None):
         logger.debug('get url={}'.format(url))
-        loop = asyncio.get_event_loop()
-        with aiohttp.ClientSession(loop=loop) as session:
-            return await(await self.method(
-                method_type='get',
-                session=session,
-                url=url,
-                params=params,
-                headers=headers,
-            )).json()
+        return await(await self.method(
+            method_type='get',
+            session=self.get_client_session(),
+            url=url,
+            params=params,
+            headers=headers,
+        )).json()
 
     async def get_raw(self, url, params=None, headers=None):
         logger.debug('get url={}'.format(url))
-        loop = asyncio.get_event_loop()
-        with aiohttp.ClientSession(loop=loop) as session:
-            res = await self.method(
-                method_type='get',
-                session=session,
-                url=url,
-                params=params,
-                headers=headers,
-            )
-            return {
-                'status': res.status,
-                'headers': res.headers,
-                'text': await res.text(),
-            }
+        res = await self.method(
+            method_type='get',
+            session=self.get_client_session(),
+            url=url,
+            params=params,
+            headers=headers,
+        )
+        return {
+            'status': res.status,
+            'headers': res.headers,
+            'text': await res.text(),
+        }
 
     async def post(self, url, params=None, headers=None, json=None):
         logger.debug('post url={}'.format(url))
         headers = headers or {}
         headers['Content-Type'] = headers.get('Content-Type', 'application/json')
-        loop = asyncio.get_event_loop()
-        with aiohttp.ClientSession(loop=loop) as session:
-            return await(await self.method(
-                method_type='post',
-                session=session,
-                url=url,
-                params=params,
-                headers=headers,
-                data=_json.dumps(json),
-            )).json()
+        return await(await self.method(
+            method_type='post',
+            session=self.get_client_session(),
+            url=url,
+            params=params,
+            headers=headers,
+            data=_json.dumps(json),
+        )).json()
 
     async def post_raw(self, url, params=None, headers=None, json=None):
         logger.debug('post url={}'.format(url))
         headers = headers or {}
         headers['Content-Type'] = headers.get('Content-Type', 'application/json')
-        loop = asyncio.get_event_loop()
-        with aiohttp.ClientSession(loop=loop) as session:
-            res = await self.method(
-                method_type='post',
-                session=session,
-                url=url,
-                params=params,
-                headers=headers,
-                data=_json.dumps(json),
-            )
-            return {
-                'status': res.status,
-                'headers': res.headers,
-                'text': await res.text(),
-            }
+        res = await self.method(
+            method_type='post',
+            session=self.get_client_session(),
+            url=url,
+            params=params,
+            headers=headers,
+            data=_json.dumps(json),
+        )
+        return {
+            'status': res.status,
+            'headers': res.headers,
+            'text': await res.text(),
+        }
 
     async def delete(self, url, params=None, headers=None, json=None):
         logger.debug('delete url={}'.format(url))
         headers = headers or {}
         headers['Content-Type'] = headers.get('Content-Type', 'application/json')
-        loop = asyncio.get_event_loop()
-        with aiohttp.ClientSession(loop=loop) as session:
-            return await(await self.method(
-                method_type='delete',
-                session=session,
-                url=url,
-                params=params,
-                headers=headers,
-                data=_json.dumps(json),
-            )).json()
+        return await(await self.method(
+            method_type='delete',
+            session=self.get_client_session(),
+            url=url,
+            params=params,
+            headers=headers,
+            data=_json.dumps(json),
+        )).json()
 
     async def method(self, method_type, session, url, **kwargs):
-        # be able to mock session from outside
-        session = self.session or session
         try:
             try:
                 method_name = getattr(session, method_type)
@@ -190,8 +283,37 @@ class AioHttpInterface:
         if self.get_app().frozen:
             raise WebhookException('Aiohttp extension is already started. '
                                    'We should change webhook before aiohttp is started.')
+        work_queue = None
+        if self.webhook_workers > 0:
+            work_queue = queue.WorkQueue(handler,
+                                         maxsize=self.webhook_queue_size,
+                                         workers=self.webhook_workers)
+            self.webhook_queues[uri] = work_queue
         self.get_app().router.add_get(uri, self.handle_webhook_validation)
-        self.get_app().router.add_post(uri, WebhookHandler(handler).handle)
+        self.get_app().router.add_post(uri, WebhookHandler(handler, work_queue).handle)
+
+    def add_get(self, uri, handler):
+        """
+        serve GET requests (for example export of metrics)
+
+        :param uri:
+        :param handler: coroutine without arguments which returns
+        arguments of response (text, status, content_type)
+        :return:
+        """
+        logger.debug('register get {}'.format(uri))
+        if self.get_app().frozen:
+            raise WebhookException('Aiohttp extension is already started. '
+                                   'We should add handler before aiohttp is started.')
+
+        async def handle(request):
+            return web.Response(**(await handler()))
+
+        self.get_app().router.add_get(uri, handle)
+
+    def get_webhook_metrics(self):
+        return {uri: work_queue.get_metrics()
+                for uri, work_queue in self.webhook_queues.items()}
 
     def handle_webhook_validation(self, request):
         params = {name: value[0] for name, value in urllib.parse.parse_qs(request.query_string).items()}
@@ -205,6 +327,7 @@ class AioHttpInterface:
 
     async def start(self):
         logger.debug('start')
+        self.get_client_session()
         if not self.has_app():
             logger.debug('does not have app')
             return
@@ -236,11 +359,27 @@ class AioHttpInterface:
         self.server = srv
         self.handler = handler
 
+    async def before_stop(self):
+        """
+        stop accepting connections and process queued webhooks
+        while storage and other extensions are still working
+        """
+        logger.debug('before_stop')
+        if self.server:
+            self.server.close()
+
+        await self.drain_webhook_queues()
+
+    async def drain_webhook_queues(self):
+        await asyncio.gather(*[work_queue.stop(self.shutdown_timeout)
+                               for work_queue in self.webhook_queues.values()])
+
     async def stop(self):
         logger.debug('stop')
 
         if not self.has_app():
             logger.debug('does not have app')
+            await self.close_client_session()
             return
 
         if self.server:
@@ -253,3 +392,9 @@ class AioHttpInterface:
 
         if self.handler:
             await self.handler.finish_connections(self.shutdown_timeout)
+
+        # if stop was called without before_stop
+        await self.drain_webhook_queues()
+
+        # webhooks could send something until the last moment
+        await self.close_client_session()
@@ -1,4 +1,5 @@
 from aiohttp import test_utils
+import asyncio
 import json
 import pytest
 from . import AioHttpInterface
@@ -83,6 +84,22 @@ async def test_reject_validation_for_incorrect_request():
         await http.stop()
 
 
+@pytest.mark.asyncio
+async def test_serve_get_handler():
+    http = AioHttpInterface(port=9876)
+    http.add_get('/metrics', test_utils.make_mocked_coro(return_value={
+        'text': 'botstory_messages_total 1.0',
+        'content_type': 'text/plain',
+    }))
+    try:
+        await http.start()
+        res = await http.get_raw('http://localhost:9876/metrics')
+        assert res['status'] == 200
+        assert res['text'] == 'botstory_messages_total 1.0'
+    finally:
+        await http.stop()
+
+
 @pytest.mark.asyncio
 async def test_should_not_create_server_if_there_wasnt_any_webhooks():
     http = AioHttpInterface(port=9876)
@@ -223,3 +240,74 @@ async def test_should_raise_exception_on_webhook_if_aiohttp_already_is_started(w
     await http.start()
     with pytest.raises(aiohttp.WebhookException):
         http.webhook(uri='/webhook', handler=webhook_handler, token='qwerty')
+
+
+@pytest.mark.asyncio
+async def test_reuse_client_session_until_stop():
+    http = AioHttpInterface(connection_limit=10, keepalive_timeout=15)
+    try:
+        await http.start()
+        session = http.get_client_session()
+        assert session
+        assert not session.closed
+        assert http.get_client_session() is session
+    finally:
+        await http.stop()
+
+    assert session.closed
+    assert not http.client_session
+
+
+@pytest.mark.asyncio
+async def test_respond_immediately_and_process_webhook_in_background(webhook_handler):
+    http = AioHttpInterface(port=9876, webhook_workers=2)
+    http.webhook(uri='/webhook', handler=webhook_handler, token='qwerty')
+    try:
+        await http.start()
+        res = await http.post_raw('http://localhost:9876/webhook', json={'message': 'Is there anybody in there?'})
+        assert res['status'] == 200
+        assert res['text'] == 'Ok!'
+    finally:
+        await http.stop()
+
+    webhook_handler.assert_called_once_with({'message': 'Is there anybody in there?'})
+    metrics = http.get_webhook_metrics()['/webhook']
+    assert metrics['received'] == 1
+    assert metrics['processed'] == 1
+    assert metrics['depth'] == 0
+
+
+@pytest.mark.asyncio
+async def test_drain_queued_webhooks_before_storage_stops():
+    global story
+    story = Story()
+
+    @di.desc('storage', reg=False)
+    class Storage:
+        def __init__(self):
+            self.collection = []
+
+        async def stop(self):
+            self.collection = None
+
+    storage = story.use(Storage())
+
+    async def handler(data):
+        await asyncio.sleep(0.01)
+        storage.collection.append(data)
+
+    http = story.use(AioHttpInterface(port=9876, webhook_workers=1))
+    http.webhook(uri='/webhook', handler=handler, token='qwerty')
+    await story.start()
+    try:
+        for idx in range(3):
+            res = await http.post_raw('http://localhost:9876/webhook', json={'idx': idx})
+            assert res['status'] == 200
+        collection = storage.collection
+    finally:
+        await story.stop()
+
+    assert collection == [{'idx': 0}, {'idx': 1}, {'idx': 2}]
+    metrics = http.get_webhook_metrics()['/webhook']
+    assert metrics['processed'] == 3
+    assert metrics['failed'] == 0
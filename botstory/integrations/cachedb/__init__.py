@@ -0,0 +1 @@
+from .db import CachedDB
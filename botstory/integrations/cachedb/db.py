@@ -0,0 +1,151 @@
+import logging
+from ... import di
+from ...utils import lru
+
+logger = logging.getLogger(__name__)
+
+USER_KEYS = ('_id', 'facebook_user_id')
+SESSION_KEYS = ('user_id', 'facebook_user_id')
+
+
+@di.desc('storage', reg=False)
+class CachedDB:
+    """
+    in-process LRU cache of users and sessions in front of any storage.
+    writes go through to the wrapped storage.
+
+    cache assumes that only this process updates users and sessions:
+
+        story.use(CachedDB(mongodb.MongodbInterface(...)))
+    """
+
+    def __init__(self, storage, max_size=10000, ttl=60):
+        """
+
+        :param storage: wrapped storage (MongodbInterface, MockDB)
+        :param max_size: max number of cached users (and sessions)
+        :param ttl: time to live of cached item in seconds
+        """
+        self.storage = storage
+        self.users = lru.LRUCache(max_size=max_size, ttl=ttl)
+        self.sessions = lru.LRUCache(max_size=max_size, ttl=ttl)
+
+    def __getattr__(self, name):
+        # forward the rest (setup, clear_collections, ...) to the wrapped storage
+        if name == 'storage':
+            raise AttributeError(name)
+        return getattr(self.storage, name)
+
+    async def start(self):
+        self.clear()
+        if hasattr(self.storage, 'start'):
+            await self.storage.start()
+
+    async def stop(self):
+        self.clear()
+        if hasattr(self.storage, 'stop'):
+            await self.storage.stop()
+
+    def clear(self):
+        self.users.clear()
+        self.sessions.clear()
+
+    def get_metrics(self):
+        return {
+            'users': self.users.get_metrics(),
+            'sessions': self.sessions.get_metrics(),
+        }
+
+    async def get_session(self, **kwargs):
+        key = get_key(kwargs, SESSION_KEYS)
+        session = key and self.sessions.get(key)
+        if session is None:
+            session = await self.storage.get_session(**kwargs)
+            self.cache_session(session)
+        return session
+
+    async def set_session(self, session):
+        res = await self.storage.set_session(session)
+        self.cache_session(session)
+        return res
+
+    async def new_session(self, **kwargs):
+        session = await self.storage.new_session(**kwargs)
+        self.cache_session(session)
+        return session
+
+    async def get_user(self, **kwargs):
+        if 'id' in kwargs:
+            kwargs['_id'] = kwargs.pop('id')
+        key = get_key(kwargs, USER_KEYS)
+        user = key and self.users.get(key)
+        if user is None:
+            user = await self.storage.get_user(**kwargs)
+            self.cache_user(user)
+        return user
+
+    async def set_user(self, user):
+        res = await self.storage.set_user(user)
+        self.cache_user(user)
+        return res
+
+    async def new_user(self, **kwargs):
+        user = await self.storage.new_user(**kwargs)
+        self.cache_user(user)
+        return user
+
+    async def get_user_and_session(self, **kwargs):
+        user_key = get_key(kwargs, USER_KEYS)
+        session_key = get_key(kwargs, SESSION_KEYS)
+        user = user_key and self.users.get(user_key)
+        session = session_key and self.sessions.get(session_key)
+
+        if user is None and session is None:
+            user, session = await self.storage.get_user_and_session(**kwargs)
+            self.cache_user(user)
+            self.cache_session(session)
+        elif user is None:
+            user = await self.get_user(**kwargs)
+        elif session is None:
+            session = await self.get_session(**kwargs)
+
+        return user, session
+
+    async def new_user_and_session(self, facebook_user_id, **kwargs):
+        user, session = await self.storage.new_user_and_session(facebook_user_id, **kwargs)
+        self.cache_user(user)
+        self.cache_session(session)
+        return user, session
+
+    def cache_user(self, user):
+        for key in get_document_keys(user, USER_KEYS):
+            self.users.set(key, user)
+
+    def cache_session(self, session):
+        for key in get_document_keys(session, SESSION_KEYS):
+            self.sessions.set(key, session)
+
+
+def get_key(query, fields):
+    """
+    only lookups by single identifying field could be cached
+
+    :param query:
+    :param fields:
+    :return: (field, value) or None
+    """
+    if len(query) != 1:
+        return None
+    field, value = next(iter(query.items()))
+    if field not in fields or value is None:
+        return None
+    return field, value
+
+
+def get_document_keys(document, fields):
+    if not document:
+        return
+    for field in fields:
+        value = document.get(field, None)
+        if value is not None:
+            yield field, value
@@ -0,0 +1,91 @@
+import pytest
+from unittest import mock
+from .. import cachedb, mockdb
+from ... import di, Story, utils
+
+story = None
+
+
+def teardown_function(function):
+    story and story.clear()
+
+
+def build_cached_db():
+    storage = mockdb.MockDB()
+    storage.get_user = mock.Mock(wraps=storage.get_user)
+    storage.get_session = mock.Mock(wraps=storage.get_session)
+    storage.get_user_and_session = mock.Mock(wraps=storage.get_user_and_session)
+    return cachedb.CachedDB(storage), storage
+
+
+@pytest.mark.asyncio
+async def test_serve_hot_user_and_session_from_cache():
+    db, storage = build_cached_db()
+    user = utils.build_fake_user()
+    session = utils.build_fake_session(user)
+    await db.set_user(user)
+    await db.set_session(session)
+
+    assert await db.get_user(facebook_user_id=user['facebook_user_id']) == user
+    assert await db.get_session(user_id=user['_id']) == session
+    assert await db.get_user_and_session(facebook_user_id=user['facebook_user_id']) == (user, session)
+
+    assert not storage.get_user.called
+    assert not storage.get_session.called
+    assert not storage.get_user_and_session.called
+    assert db.get_metrics()['users']['hits'] == 2
+    assert db.get_metrics()['sessions']['hits'] == 2
+
+
+@pytest.mark.asyncio
+async def test_fetch_missed_user_from_storage_once():
+    db, storage = build_cached_db()
+    user = utils.build_fake_user()
+    storage.user = user
+
+    assert await db.get_user(id=user['_id']) == user
+    assert await db.get_user(facebook_user_id=user['facebook_user_id']) == user
+
+    assert storage.get_user.call_count == 1
+    assert db.get_metrics()['users']['misses'] == 1
+
+
+@pytest.mark.asyncio
+async def test_write_through_session():
+    db, storage = build_cached_db()
+    session = utils.build_fake_session()
+    await db.set_session(session)
+
+    assert storage.session == session
+
+
+@pytest.mark.asyncio
+async def test_do_not_cache_absent_user():
+    db, storage = build_cached_db()
+
+    assert await db.get_user(facebook_user_id='1234567890') is None
+    assert await db.get_user(facebook_user_id='1234567890') is None
+    assert storage.get_user.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_forward_other_methods_to_storage():
+    db, storage = build_cached_db()
+    await db.setup()
+    storage.setup.assert_called_once_with()
+
+
+def test_get_cached_db_as_storage():
+    global story
+    story = Story()
+
+    story.use(cachedb.CachedDB(mockdb.MockDB()))
+
+    with di.child_scope():
+        @di.desc()
+        class OneClass:
+            @di.inject()
+            def deps(self, storage):
+                self.storage = storage
+
+        assert isinstance(di.injector.get('one_class').storage, cachedb.CachedDB)
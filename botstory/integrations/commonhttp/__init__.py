@@ -1 +1 @@
-from . import errors, statuses
+from . import errors, retry, statuses
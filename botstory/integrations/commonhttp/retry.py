@@ -0,0 +1,119 @@
+"""
+when and how long we should wait before retrying failed request
+"""
+
+import email.utils
+import json
+import random
+import time
+
+from . import statuses
+
+# error codes of Graph API which mean that we are throttled
+# https://developers.facebook.com/docs/graph-api/using-graph-api/error-handling
+THROTTLING_ERROR_CODES = {4, 17, 32, 613}
+
+
+def get_header(headers, name):
+    if not headers:
+        return None
+    try:
+        return headers.get(name, None)
+    except AttributeError:
+        # list of (name, value) pairs
+        for key, value in headers:
+            if key.lower() == name.lower():
+                return value
+    return None
+
+
+def get_error_code(err):
+    """
+    code of error in json body of Graph API response
+
+    :param err: HttpRequestError
+    :return:
+    """
+    try:
+        return json.loads(err.message)['error']['code']
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+def is_throttled(err):
+    return err.code == statuses.HTTP_429_TOO_MANY_REQUESTS or \
+           get_error_code(err) in THROTTLING_ERROR_CODES
+
+
+def is_retriable(err):
+    return is_throttled(err) or err.code >= 500
+
+
+def parse_retry_after(value, now=None):
+    """
+    value of Retry-After header is either seconds or http-date
+
+    :param value:
+    :param now: current unix time
+    :return: seconds or None
+    """
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date is None:
+        return None
+    now = time.time() if now is None else now
+    return max(date.timestamp() - now, 0)
+
+
+def parse_business_usage(value):
+    """
+    X-Business-Use-Case-Usage header of Graph API
+    tells how many minutes left until we regain access
+
+    :param value:
+    :return: seconds or None
+    """
+    if not value:
+        return None
+    try:
+        usages = json.loads(value)
+        minutes = max(usage.get('estimated_time_to_regain_access', 0)
+                      for items in usages.values()
+                      for usage in items)
+    except (ValueError, TypeError, AttributeError):
+        return None
+    return minutes * 60 if minutes else None
+
+
+def get_retry_after(err):
+    """
+    how long server has asked us to wait
+
+    :param err: HttpRequestError
+    :return: seconds or None
+    """
+    retry_after = parse_retry_after(get_header(err.headers, 'Retry-After'))
+    if retry_after is not None:
+        return retry_after
+    return parse_business_usage(get_header(err.headers, 'X-Business-Use-Case-Usage'))
+
+
+def backoff(attempt, base=0.5, max_delay=60, rand=random.random):
+    """
+    exponential backoff with full jitter
+
+    :param attempt: number of failed attempts (from 0)
+    :param base: delay of the first retry
+    :param max_delay:
+    :param rand: source of random in [0, 1)
+    :return: seconds
+    """
+    return rand() * min(max_delay, base * 2 ** attempt)
@@ -0,0 +1,58 @@
+import json
+import pytest
+
+from . import errors, retry
+
+
+def test_retry_throttled_and_server_errors():
+    assert retry.is_retriable(errors.HttpRequestError(code=429))
+    assert retry.is_retriable(errors.HttpRequestError(code=503))
+    assert not retry.is_retriable(errors.HttpRequestError(code=404))
+    assert not retry.is_retriable(errors.HttpRequestError())
+
+
+def test_recognize_throttling_error_of_graph_api():
+    err = errors.HttpRequestError(code=400, message=json.dumps({
+        'error': {
+            'message': '(#613) Calls to this api have exceeded the rate limit.',
+            'code': 613,
+        },
+    }))
+    assert retry.is_throttled(err)
+    assert retry.is_retriable(err)
+
+
+@pytest.mark.parametrize(('value', 'seconds'), [
+    (None, None),
+    ('5', 5),
+    ('-1', 0),
+    ('Wed, 21 Oct 2015 07:28:10 GMT', 10),
+    ('tomorrow', None),
+])
+def test_parse_retry_after(value, seconds):
+    assert retry.parse_retry_after(value, now=1445412480) == seconds
+
+
+def test_get_zero_retry_after():
+    err = errors.HttpRequestError(code=429, headers={'Retry-After': '0'})
+    assert retry.get_retry_after(err) == 0
+
+
+def test_get_retry_after_from_business_usage():
+    err = errors.HttpRequestError(code=400, headers={
+        'X-Business-Use-Case-Usage': json.dumps({
+            '1234': [{
+                'type': 'messenger',
+                'call_count': 100,
+                'estimated_time_to_regain_access': 2,
+            }],
+        }),
+    })
+    assert retry.get_retry_after(err) == 120
+
+
+def test_backoff_grows_exponentially_up_to_limit():
+    assert retry.backoff(0, base=0.5, rand=lambda: 1) == 0.5
+    assert retry.backoff(3, base=0.5, rand=lambda: 1) == 4
+    assert retry.backoff(10, base=0.5, max_delay=60, rand=lambda: 1) == 60
+    assert 0 <= retry.backoff(3, base=0.5) < 4
@@ -1 +1,4 @@
+HTTP_400_BAD_REQUEST = 400
 HTTP_422_UNPROCESSABLE_ENTITY = 422
+HTTP_429_TOO_MANY_REQUESTS = 429
+HTTP_500_INTERNAL_SERVER_ERROR = 500
@@ -1 +1 @@
-from .messenger import FBInterface
+from .messenger import FBInterface, SendQueueFullError
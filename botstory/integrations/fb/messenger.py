@@ -1,13 +1,21 @@
 import asyncio
+import collections
+import copy
 import logging
+import time
 from . import validate
 from .. import commonhttp
 from ... import di
 from ...middlewares import option
+from ...utils import broadcast, lock, lru, rate
 
 logger = logging.getLogger(__name__)
 
 
+class SendQueueFullError(Exception):
+    pass
+
+
 @di.desc('fb', reg=False)
 class FBInterface:
     type = 'facebook'
@@ -19,6 +27,19 @@ class FBInterface:
                  persistent_menu=None,
                  webhook_url=None,
                  webhook_token=None,
+                 concurrency_limit=16,
+                 profile_cache_size=1000,
+                 profile_cache_ttl=3600,
+                 profile_failure_ttl=60,
+                 send_rate=None,
+                 send_burst=None,
+                 recipient_rate=None,
+                 recipient_burst=None,
+                 send_retries=5,
+                 send_retry_delay=0.5,
+                 send_max_retry_delay=60,
+                 send_queue_size=1000,
+                 send_max_waiting=10000,
                  ):
         """
 
@@ -28,6 +49,24 @@ class FBInterface:
         :param persistent_menu:
         :param webhook_url:
         :param webhook_token:
+        :param concurrency_limit: how many users of one webhook request
+        we could process simultaneously
+        :param profile_cache_size: how many profiles of users we keep
+        :param profile_cache_ttl: how long (in seconds) we keep received profile
+        :param profile_failure_ttl: how long (in seconds) we remember
+        that we couldn't get profile
+        :param send_rate: max number of requests to Graph API per second (None - unlimited)
+        :param send_burst: how many requests we could send at once
+        :param recipient_rate: max number of messages to one user per second (None - unlimited)
+        :param recipient_burst: how many messages we could send to one user at once
+        :param send_retries: how many times we retry throttled (429) or failed (5xx) request
+        :param send_retry_delay: delay (in seconds) of the first retry.
+        it grows exponentially with random jitter unless server tells us how long to wait
+        :param send_max_retry_delay: max delay (in seconds) of one retry
+        :param send_queue_size: max number of outgoing requests in progress (including retries).
+        once it is full new requests wait for free slot
+        :param send_max_waiting: max number of requests which wait for free slot.
+        once it is reached new requests are rejected with SendQueueFullError
         """
         self.api_uri = api_uri
         self.greeting_text = greeting_text
@@ -35,12 +74,34 @@ class FBInterface:
         self.token = page_access_token
         self.webhook = webhook_url
         self.webhook_token = webhook_token
+        self.concurrency_limit = concurrency_limit
 
         self.library = None
         self.http = None
         self.story_processor = None
         self.storage = None
         self.users = None
+        self.metrics = None
+
+        # load, process and store session of one user one by one
+        self.user_lock = lock.KeyLock()
+
+        self.profile_failure_ttl = profile_failure_ttl
+        self.profiles = lru.LRUCache(max_size=profile_cache_size, ttl=profile_cache_ttl)
+        # facebook_user_id -> in-flight request of profile
+        self.profile_requests = {}
+
+        self.rate_limiter = rate.RateLimiter(rate=send_rate, capacity=send_burst,
+                                             per_key_rate=recipient_rate,
+                                             per_key_capacity=recipient_burst)
+        self.send_retries = send_retries
+        self.send_retry_delay = send_retry_delay
+        self.send_max_retry_delay = send_max_retry_delay
+        self.send_queue_size = send_queue_size
+        self.send_max_waiting = send_max_waiting
+        # created once we have running loop
+        self.send_slots = None
+        self.send_stats = collections.Counter()
 
     @di.inject()
     def add_library(self, stories_library):
@@ -72,6 +133,12 @@ class FBInterface:
         logger.debug(storage)
         self.storage = storage
 
+    @di.inject()
+    def add_metrics(self, metrics):
+        logger.debug('add_metrics')
+        logger.debug(metrics)
+        self.metrics = metrics
+
     @di.inject()
     def add_users(self, users):
         logger.debug('add_users')
@@ -106,7 +173,9 @@ class FBInterface:
         if len(quick_replies) > 0:
             message['quick_replies'] = quick_replies
 
-        return await self.http.post(
+        return await self.call_api(
+            recipient['facebook_user_id'],
+            self.http.post,
             self.api_uri + '/me/messages/',
             params={
                 'access_token': self.token,
@@ -118,6 +187,106 @@ class FBInterface:
                 'message': message,
             })
 
+    async def broadcast(self, text, users, options=None,
+                        concurrency=100, on_progress=None, progress_interval=1000):
+        """
+        send message to many facebook users.
+        sends share pool of connections, rate limits and retries
+
+        :param text:
+        :param users: iterable or async iterable of users
+        (for example storage.iter_users(facebook_user_id={'$exists': True}))
+        :param options: (optional) quick replies
+        :param concurrency: max number of simultaneous sends
+        :param on_progress: (optional) function which receives report
+        once in progress_interval users
+        :param progress_interval:
+        :return: report with number of sent and failed messages
+        """
+
+        async def send(user):
+            await self.send_text_message(user, text, options)
+
+        return await broadcast.Broadcast(send,
+                                         concurrency=concurrency,
+                                         on_progress=on_progress,
+                                         progress_interval=progress_interval).run(users)
+
+    async def call_api(self, recipient_id, method, *args, **kwargs):
+        """
+        request Graph API within rate limits
+        and retry throttled (429) or failed (5xx) requests with backoff
+
+        :param recipient_id: (optional) user whom request is addressed to
+        :param method: method of http interface (post, get, ...)
+        :return: result of method
+        """
+        if self.send_slots is None:
+            self.send_slots = asyncio.Semaphore(self.send_queue_size)
+
+        if self.send_stats['waiting'] >= self.send_max_waiting:
+            self.send_stats['rejected'] += 1
+            raise SendQueueFullError('{} requests are already waiting'.format(self.send_stats['waiting']))
+
+        self.send_stats['waiting'] += 1
+        try:
+            await self.send_slots.acquire()
+        finally:
+            self.send_stats['waiting'] -= 1
+
+        self.send_stats['in_progress'] += 1
+        try:
+            attempt = 0
+            while True:
+                await self.rate_limiter.acquire(recipient_id)
+                try:
+                    res = await method(*args, **kwargs)
+                    self.send_stats['sent'] += 1
+                    return res
+                except commonhttp.errors.HttpRequestError as err:
+                    if not commonhttp.retry.is_retriable(err) or attempt >= self.send_retries:
+                        self.send_stats['failed'] += 1
+                        if self.metrics:
+                            self.metrics.increment('api_failures', code=err.code)
+                        raise
+                    delay = self.get_retry_delay(err, attempt)
+                    logger.debug('retry request to %s in %s seconds because of %s',
+                                 recipient_id, delay, err.code)
+                    if commonhttp.retry.is_throttled(err):
+                        self.send_stats['throttled'] += 1
+                        # everybody should slow down
+                        self.rate_limiter.pause(delay)
+                    self.send_stats['retries'] += 1
+                    if self.metrics:
+                        self.metrics.increment('api_retries', code=err.code)
+                    attempt += 1
+                    await asyncio.sleep(delay)
+        finally:
+            self.send_stats['in_progress'] -= 1
+            self.send_slots.release()
+
+    def get_retry_delay(self, err, attempt):
+        retry_after = commonhttp.retry.get_retry_after(err)
+        if retry_after is not None:
+            return min(retry_after, self.send_max_retry_delay)
+        return commonhttp.retry.backoff(attempt,
+                                        base=self.send_retry_delay,
+                                        max_delay=self.send_max_retry_delay)
+
+    def get_send_metrics(self):
+        return {
+            'waiting': self.send_stats['waiting'],
+            'max_waiting': self.send_max_waiting,
+            'in_progress': self.send_stats['in_progress'],
+            'max_in_progress': self.send_queue_size,
+            'rejected': self.send_stats['rejected'],
+            'sent': self.send_stats['sent'],
+            'failed': self.send_stats['failed'],
+            'retries': self.send_stats['retries'],
+            'throttled': self.send_stats['throttled'],
+            'rate_limiter': self.rate_limiter.get_metrics(),
+        }
+
     async def request_profile(self, facebook_user_id):
         """
         Make request to facebook
@@ -128,118 +297,217 @@ class FBInterface:
         :param facebook_user_id:
         :return:
         """
-        return await self.http.get(
+        return await self.call_api(
+            None,
+            self.http.get,
             '{}/{}'.format(self.api_uri, facebook_user_id),
             params={
                 'access_token': self.token,
             },
         )
 
+    async def get_profile(self, facebook_user_id):
+        """
+        get cached profile of user or request it.
+        concurrent calls for the same user share one request
+
+        :param facebook_user_id:
+        :return: profile or {'no_fb_profile': True} if we couldn't get it
+        """
+        profile = self.profiles.get(facebook_user_id)
+        if profile is not None:
+            return profile
+
+        request = self.profile_requests.get(facebook_user_id, None)
+        if request is None:
+            request = asyncio.ensure_future(self.fetch_profile(facebook_user_id))
+            self.profile_requests[facebook_user_id] = request
+            request.add_done_callback(
+                lambda _: self.profile_requests.pop(facebook_user_id, None))
+
+        # one waiter shouldn't cancel request of others
+        return await asyncio.shield(request)
+
+    async def fetch_profile(self, facebook_user_id):
+        try:
+            profile = await self.request_profile(facebook_user_id)
+            logger.debug('receive fb profile %s', profile)
+            self.profiles.set(facebook_user_id, profile)
+        except commonhttp.errors.HttpRequestError as err:
+            logger.debug('fail on request fb profile of %s. with %s', facebook_user_id, err)
+            profile = {
+                'no_fb_profile': True,
+            }
+            self.profiles.set(facebook_user_id, profile, ttl=self.profile_failure_ttl)
+        return profile
+
     async def handle(self, data):
         logger.debug('')
         logger.debug('> handle <')
         logger.debug('')
-        logger.debug('  entry: {}'.format(data))
+        logger.debug('  entry: %s', data)
+        metrics = self.metrics
+        if metrics:
+            started_at = time.perf_counter()
         try:
+            # facebook batches events of different users in one request
+            # so we process users concurrently but events of each user in order
+            events_by_user = collections.OrderedDict()
             for e in data.get('entry', []):
                 messaging = e.get('messaging', [])
-                logger.debug('  messaging: {}'.format(messaging))
+                logger.debug('  messaging: %s', messaging)
 
                 if len(messaging) == 0:
-                    logger.warning('  entry {} list lack of "messaging" field'.format(e))
+                    logger.warning('  entry %s list lack of "messaging" field', e)
 
                 for m in messaging:
-                    logger.debug('  m: {}'.format(m))
-
-                    facebook_user_id = m['sender']['id']
-
-                    logger.debug('before get user with facebook_user_id={}'.format(facebook_user_id))
-                    user = await self.storage.get_user(facebook_user_id=facebook_user_id)
-                    if not user:
-                        logger.debug('  should create new user {}'.format(facebook_user_id))
-
-                        try:
-                            messenger_profile_data = await self.request_profile(facebook_user_id)
-                            logger.debug('receive fb profile {}'.format(messenger_profile_data))
-                        except commonhttp.errors.HttpRequestError as err:
-                            logger.debug('fail on request fb profile of {}. with {}'.format(facebook_user_id, err))
-                            messenger_profile_data = {
-                                'no_fb_profile': True,
-                            }
-
-                        logger.debug('before creating new user')
-                        user = await self.storage.new_user(
-                            facebook_user_id=facebook_user_id,
-                            no_fb_profile=messenger_profile_data.get('no_fb_profile', None),
-                            first_name=messenger_profile_data.get('first_name', None),
-                            last_name=messenger_profile_data.get('last_name', None),
-                            profile_pic=messenger_profile_data.get('profile_pic', None),
-                            locale=messenger_profile_data.get('locale', None),
-                            timezone=messenger_profile_data.get('timezone', None),
-                            gender=messenger_profile_data.get('gender', None),
-                        )
-
-                        self.users.on_new_user_comes(user)
-
-                    session = await self.storage.get_session(facebook_user_id=facebook_user_id)
-                    if not session:
-                        logger.debug('  should create new session for user {}'.format(facebook_user_id))
-                        session = await self.storage.new_session(
-                            facebook_user_id=facebook_user_id,
-                            stack=[],
-                            user=user,
-                        )
-
-                    message = {
-                        'session': session,
-                        'user': user,
-                    }
+                    events_by_user.setdefault(m['sender']['id'], []).append((e, m))
 
-                    if 'message' in m:
-                        logger.debug('message notification')
-                        raw_message = m.get('message', {})
-                        if 'is_echo' in raw_message:
-                            # TODO: should react somehow.
-                            # for example storing for debug purpose
-                            logger.debug('just echo message')
-                        else:
-                            data = {}
-                            text = raw_message.get('text', None)
-                            if text is not None:
-                                data['text'] = {
-                                    'raw': text,
-                                }
-                            else:
-                                logger.warning('  entry {} "text"'.format(e))
-
-                            quick_reply = raw_message.get('quick_reply', None)
-                            if quick_reply is not None:
-                                data['option'] = quick_reply['payload']
-
-                            message['data'] = data
-
-                            await self.story_processor.match_message(message)
-
-                    elif 'postback' in m:
-                        message['data'] = {
-                            'option': m['postback']['payload'],
-                        }
-                        await self.story_processor.match_message(message)
-                    elif 'delivery' in m:
-                        logger.debug('delivery notification')
-                    elif 'read' in m:
-                        logger.debug('read notification')
-                    else:
-                        logger.warning('(!) unknown case {}'.format(e))
+            semaphore = asyncio.Semaphore(self.concurrency_limit)
+            await asyncio.gather(*[
+                self.handle_user_events(facebook_user_id, events, semaphore)
+                for facebook_user_id, events in events_by_user.items()
+            ])
 
         except BaseException as err:
             logger.exception(err)
 
+        if metrics:
+            metrics.observe('stage_seconds', time.perf_counter() - started_at, stage='webhook')
+
         return {
             'status': 200,
             'text': 'Ok!',
         }
 
+    async def handle_user_events(self, facebook_user_id, events, semaphore):
+        """
+        process events of one user one by one
+
+        :param facebook_user_id:
+        :param events: list of (entry, messaging) pairs
+        :param semaphore: limit of concurrently processed users
+        :return:
+        """
+        async with semaphore:
+            for e, m in events:
+                try:
+                    await self.handle_messaging(facebook_user_id, e, m)
+                except Exception as err:
+                    logger.exception(err)
+
+    async def handle_messaging(self, facebook_user_id, e, m):
+        async with self.user_lock(facebook_user_id):
+            await self.process_messaging(facebook_user_id, e, m)
+
+    async def process_messaging(self, facebook_user_id, e, m):
+        logger.debug('  m: %s', m)
+
+        logger.debug('before get user with facebook_user_id=%s', facebook_user_id)
+        metrics = self.metrics
+        if metrics:
+            started_at = time.perf_counter()
+        user, session = await self.storage.get_user_and_session(facebook_user_id=facebook_user_id)
+        if metrics:
+            metrics.observe('stage_seconds', time.perf_counter() - started_at, stage='storage_read')
+        if not user:
+            logger.debug('  should create new user %s', facebook_user_id)
+
+            if metrics:
+                started_at = time.perf_counter()
+            messenger_profile_data = await self.get_profile(facebook_user_id)
+            if metrics:
+                metrics.observe('stage_seconds', time.perf_counter() - started_at, stage='profile')
+
+            logger.debug('before creating new user')
+            user_fields = {
+                'no_fb_profile': messenger_profile_data.get('no_fb_profile', None),
+                'first_name': messenger_profile_data.get('first_name', None),
+                'last_name': messenger_profile_data.get('last_name', None),
+                'profile_pic': messenger_profile_data.get('profile_pic', None),
+                'locale': messenger_profile_data.get('locale', None),
+                'timezone': messenger_profile_data.get('timezone', None),
+                'gender': messenger_profile_data.get('gender', None),
+            }
+            if session:
+                user = await self.storage.new_user(facebook_user_id=facebook_user_id, **user_fields)
+            else:
+                user, session = await self.storage.new_user_and_session(facebook_user_id, **user_fields)
+
+            self.users.on_new_user_comes(user)
+
+        if not session:
+            logger.debug('  should create new session for user %s', facebook_user_id)
+            session = await self.storage.new_session(
+                facebook_user_id=facebook_user_id,
+                stack=[],
+                user=user,
+            )
+
+        message = {
+            'session': session,
+            'user': user,
+        }
+
+        if 'message' in m:
+            logger.debug('message notification')
+            raw_message = m.get('message', {})
+            if 'is_echo' in raw_message:
+                # TODO: should react somehow.
+                # for example storing for debug purpose
+                logger.debug('just echo message')
+            else:
+                data = {}
+                text = raw_message.get('text', None)
+                if text is not None:
+                    data['text'] = {
+                        'raw': text,
+                    }
+                else:
+                    logger.warning('  entry %s "text"', e)
+
+                quick_reply = raw_message.get('quick_reply', None)
+                if quick_reply is not None:
+                    data['option'] = quick_reply['payload']
+
+                message['data'] = data
+
+                await self.process_message(message)
+
+        elif 'postback' in m:
+            message['data'] = {
+                'option': m['postback']['payload'],
+            }
+            await self.process_message(message)
+        elif 'delivery' in m:
+            logger.debug('delivery notification')
+        elif 'read' in m:
+            logger.debug('read notification')
+        else:
+            logger.warning('(!) unknown case %s', e)
+
+    async def process_message(self, message):
+        """
+        process message by stories and store session
+        only if its stack has changed
+
+        :param message:
+        :return:
+        """
+        session = message['session']
+        stack_before = copy.deepcopy(session['stack'])
+
+        await self.story_processor.match_message(message)
+
+        if session['stack'] != stack_before:
+            logger.debug('  store changed session')
+            metrics = self.metrics
+            if metrics:
+                started_at = time.perf_counter()
+            await self.storage.set_session(session)
+            if metrics:
+                metrics.observe('stage_seconds', time.perf_counter() - started_at, stage='storage_write')
+
     async def setup(self):
         logger.debug('setup')
 
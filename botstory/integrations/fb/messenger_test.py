@@ -50,6 +50,220 @@ async def test_send_text_message():
     )
 
 
+def build_flaky_post(failures):
+    """
+    post which raises each of failures in turn and then succeeds
+    """
+    calls = []
+
+    async def post(*args, **kwargs):
+        calls.append(kwargs)
+        if len(calls) <= len(failures):
+            raise failures[len(calls) - 1]
+        return {'status': 'ok'}
+
+    return post, calls
+
+
+@pytest.mark.asyncio
+async def test_retry_throttled_and_failed_send():
+    global story
+    story = Story()
+
+    interface = story.use(messenger.FBInterface(
+        page_access_token='qwerty1',
+        send_retry_delay=0.001,
+    ))
+    mock_http = story.use(mockhttp.MockHttpInterface())
+    mock_http.post, calls = build_flaky_post([
+        commonhttp.errors.HttpRequestError(code=429, headers={'Retry-After': '0'}),
+        commonhttp.errors.HttpRequestError(code=503),
+    ])
+
+    await story.start()
+
+    assert await interface.send_text_message(
+        recipient=utils.build_fake_user(), text='hi!'
+    ) == {'status': 'ok'}
+    assert len(calls) == 3
+    metrics = interface.get_send_metrics()
+    assert metrics['sent'] == 1
+    assert metrics['retries'] == 2
+    assert metrics['throttled'] == 1
+    assert metrics['failed'] == 0
+    assert metrics['in_progress'] == 0
+
+
+@pytest.mark.asyncio
+async def test_give_up_after_limit_of_retries():
+    global story
+    story = Story()
+
+    interface = story.use(messenger.FBInterface(
+        page_access_token='qwerty1',
+        send_retries=2,
+        send_retry_delay=0.001,
+    ))
+    mock_http = story.use(mockhttp.MockHttpInterface())
+    mock_http.post, calls = build_flaky_post([
+        commonhttp.errors.HttpRequestError(code=500),
+    ] * 5)
+
+    await story.start()
+
+    with pytest.raises(commonhttp.errors.HttpRequestError):
+        await interface.send_text_message(recipient=utils.build_fake_user(), text='hi!')
+    assert len(calls) == 3
+    assert interface.get_send_metrics()['failed'] == 1
+
+
+@pytest.mark.asyncio
+async def test_should_not_retry_bad_request():
+    global story
+    story = Story()
+
+    interface = story.use(messenger.FBInterface(page_access_token='qwerty1'))
+    mock_http = story.use(mockhttp.MockHttpInterface())
+    mock_http.post, calls = build_flaky_post([
+        commonhttp.errors.HttpRequestError(code=400),
+    ])
+
+    await story.start()
+
+    with pytest.raises(commonhttp.errors.HttpRequestError):
+        await interface.send_text_message(recipient=utils.build_fake_user(), text='hi!')
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_reject_send_once_too_many_requests_are_waiting():
+    global story
+    story = Story()
+
+    interface = story.use(messenger.FBInterface(
+        page_access_token='qwerty1',
+        send_queue_size=1,
+        send_max_waiting=1,
+    ))
+    mock_http = story.use(mockhttp.MockHttpInterface())
+    release = asyncio.Event()
+
+    async def post(*args, **kwargs):
+        await release.wait()
+        return {'status': 'ok'}
+
+    mock_http.post = post
+
+    await story.start()
+
+    user = utils.build_fake_user()
+    in_progress = asyncio.ensure_future(interface.send_text_message(recipient=user, text='one'))
+    waiting = asyncio.ensure_future(interface.send_text_message(recipient=user, text='two'))
+    await asyncio.sleep(0)
+
+    with pytest.raises(messenger.SendQueueFullError):
+        await interface.send_text_message(recipient=user, text='three')
+
+    release.set()
+    await asyncio.gather(in_progress, waiting)
+    metrics = interface.get_send_metrics()
+    assert metrics['sent'] == 2
+    assert metrics['rejected'] == 1
+    assert metrics['waiting'] == 0
+
+
+def test_create_slots_of_send_queue_in_loop_of_sender():
+    interface = messenger.FBInterface(page_access_token='qwerty1', send_queue_size=1)
+    assert interface.send_slots is None
+
+    async def post(*args, **kwargs):
+        await asyncio.sleep(0.001)
+        return {'status': 'ok'}
+
+    async def send_concurrently():
+        await asyncio.gather(*[interface.call_api('USER_ID', post) for _ in range(3)])
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(send_concurrently())
+    finally:
+        loop.close()
+    assert interface.get_send_metrics()['sent'] == 3
+
+
+@pytest.mark.asyncio
+async def test_throttled_response_slows_down_other_recipients():
+    global story
+    story = Story()
+
+    interface = story.use(messenger.FBInterface(page_access_token='qwerty1'))
+    mock_http = story.use(mockhttp.MockHttpInterface())
+    mock_http.post, calls = build_flaky_post([
+        commonhttp.errors.HttpRequestError(code=429, headers={'Retry-After': '0.05'}),
+    ])
+
+    await story.start()
+
+    throttled = asyncio.ensure_future(
+        interface.send_text_message(recipient=utils.build_fake_user(), text='hi!'))
+    await asyncio.sleep(0.01)
+    await interface.send_text_message(recipient=utils.build_fake_user(), text='hi!')
+    await throttled
+
+    assert interface.get_send_metrics()['rate_limiter']['delayed'] >= 1
+
+
+@pytest.mark.asyncio
+async def test_limit_rate_of_messages_to_one_recipient():
+    global story
+    story = Story()
+
+    interface = story.use(messenger.FBInterface(
+        page_access_token='qwerty1',
+        recipient_rate=100,
+        recipient_burst=1,
+    ))
+    story.use(mockhttp.MockHttpInterface())
+
+    await story.start()
+
+    user = utils.build_fake_user()
+    await asyncio.gather(*[interface.send_text_message(recipient=user, text='hi!')
+                           for _ in range(3)])
+    assert interface.get_send_metrics()['rate_limiter']['delayed'] == 2
+
+
+@pytest.mark.asyncio
+async def test_broadcast_stored_users():
+    global story
+    story = Story()
+
+    interface = story.use(messenger.FBInterface(page_access_token='qwerty1'))
+    mock_http = story.use(mockhttp.MockHttpInterface())
+    db = story.use(mockdb.MockDB())
+
+    await story.start()
+
+    user = await db.new_user(facebook_user_id='USER_ID')
+    report = await interface.broadcast('Happy New Year!', db.iter_users())
+
+    assert report['sent'] == 1
+    mock_http.post.assert_called_with(
+        'https://graph.facebook.com/v2.6/me/messages/',
+        params={
+            'access_token': 'qwerty1',
+        },
+        json={
+            'message': {
+                'text': 'Happy New Year!',
+            },
+            'recipient': {
+                'id': user['facebook_user_id'],
+            },
+        }
+    )
+
+
 @pytest.mark.asyncio
 async def test_integration():
     user = utils.build_fake_user()
@@ -579,6 +793,104 @@ async def test_should_not_process_echo_delivery_and_read_messages_as_regular(bui
     assert not echo_trigger.is_triggered
 
 
+def build_text_messaging(sender_id, text):
+    return {
+        'sender': {
+            'id': sender_id,
+        },
+        'recipient': {
+            'id': 'PAGE_ID',
+        },
+        'timestamp': 1458692752478,
+        'message': {
+            'text': text,
+        },
+    }
+
+
+@pytest.mark.asyncio
+async def test_process_users_concurrently_but_messages_of_one_user_in_order(build_fb_interface):
+    fb_interface, story = await build_fb_interface()
+    # each user will get its own new session
+    fb_interface.storage.session = None
+
+    log = []
+
+    @story.on(receive=any.Any())
+    def echo_story():
+        @story.part()
+        async def store_text(message):
+            text = message['data']['text']['raw']
+            log.append('start {}'.format(text))
+            await asyncio.sleep(0.01)
+            log.append('end {}'.format(text))
+
+    await fb_interface.handle({
+        'object': 'page',
+        'entry': [{
+            'id': 'PAGE_ID',
+            'time': 1473204787206,
+            'messaging': [
+                build_text_messaging('USER_1', 'first of user 1'),
+                build_text_messaging('USER_2', 'first of user 2'),
+                build_text_messaging('USER_1', 'second of user 1'),
+            ]
+        }]
+    })
+
+    assert len(log) == 6
+    # events of one user in order
+    assert log.index('end first of user 1') < log.index('start second of user 1')
+    # but different users at the same time
+    assert log.index('start first of user 2') < log.index('end first of user 1')
+
+
+@pytest.mark.asyncio
+async def test_store_session_only_if_its_stack_has_changed(build_fb_interface):
+    fb_interface, story = await build_fb_interface()
+    story.use(mockhttp.MockHttpInterface())
+    fb_interface.storage.session['stack'] = [{
+        'data': None,
+        'step': 0,
+        'topic': None,
+    }]
+
+    @story.on('hi there!')
+    def greeting_story():
+        @story.part()
+        async def ask(message):
+            return await story.ask('How are you?', user=message['user'])
+
+        @story.part()
+        def receive_answer(message):
+            pass
+
+    with mock.patch.object(fb_interface.storage, 'set_session',
+                           wraps=fb_interface.storage.set_session) as set_session:
+        await fb_interface.handle({
+            'object': 'page',
+            'entry': [{
+                'id': 'PAGE_ID',
+                'time': 1473204787206,
+                'messaging': [build_text_messaging('USER_ID', 'unknown message')],
+            }]
+        })
+
+        assert not set_session.called
+
+        await fb_interface.handle({
+            'object': 'page',
+            'entry': [{
+                'id': 'PAGE_ID',
+                'time': 1473204787206,
+                'messaging': [build_text_messaging('USER_ID', 'hi there!')],
+            }]
+        })
+
+        assert set_session.call_count == 1
+        assert set_session.call_args[0][0]['stack'][0]['topic'] == 'greeting_story'
+
+
 @pytest.mark.asyncio
 async def test_set_greeting_text():
     global story
@@ -917,6 +1229,38 @@ def test_get_fb_as_deps():
         assert isinstance(di.injector.get('one_class').fb, messenger.FBInterface)
 
 
+@pytest.mark.asyncio
+async def test_share_one_profile_request_between_concurrent_calls():
+    global story
+    story = Story()
+    fb_interface = story.use(messenger.FBInterface())
+    http = story.use(mockhttp.MockHttpInterface(get={'first_name': 'Peter'}))
+
+    profiles = await asyncio.gather(
+        fb_interface.get_profile('USER_ID'),
+        fb_interface.get_profile('USER_ID'),
+    )
+    assert profiles == [{'first_name': 'Peter'}, {'first_name': 'Peter'}]
+    assert await fb_interface.get_profile('USER_ID') == {'first_name': 'Peter'}
+
+    assert http.get.call_count == 1
+    assert fb_interface.profile_requests == {}
+
+
+@pytest.mark.asyncio
+async def test_remember_failed_profile_request():
+    global story
+    story = Story()
+    fb_interface = story.use(messenger.FBInterface())
+    http = story.use(mockhttp.MockHttpInterface(
+        get_raise=commonhttp.errors.HttpRequestError()))
+
+    assert await fb_interface.get_profile('USER_ID') == {'no_fb_profile': True}
+    assert await fb_interface.get_profile('USER_ID') == {'no_fb_profile': True}
+
+    assert http.get.call_count == 1
+
+
 def test_bind_fb_deps():
     global story
     story = Story()
@@ -5,13 +5,13 @@ social: network, action [, target ]
 timing: category, variable, time [, label ]
 """
 
-import functools
 import json
 import logging
+from .universal_analytics.batch import BatchSender
 from .universal_analytics.tracker import Tracker
 
 from ... import di
-from ...utils import queue
+from ...utils import lru, queue
 
 logger = logging.getLogger(__name__)
 
@@ -23,25 +23,82 @@ class GAStatistics:
                  tracking_id=None,
                  story_tracking_template='{story}/{part}',
                  new_message_tracking_template='receive: {data}',
+                 batch=False,
+                 batch_size=20,
+                 batch_buffer_size=1000,
+                 batch_flush_interval=1.0,
+                 queue_size=1000,
+                 workers=4,
+                 shutdown_timeout=10,
+                 trackers_cache_size=1000,
                  ):
         """
         :param tracking_id: should be like UA-XXXXX-Y
+        :param batch: accumulate hits and send them by batches
+        :param batch_size: max number of hits in one request (up to 20)
+        :param batch_buffer_size: max number of waiting hits
+        (the oldest are dropped on overflow)
+        :param batch_flush_interval: how often (in seconds) we send accumulated hits
+        :param queue_size: max number of hits which wait for sending
+        (new hits are dropped on overflow)
+        :param workers: how many hits we send simultaneously
+        :param shutdown_timeout: how long (in seconds) we wait for the rest of hits on stop
+        :param trackers_cache_size: how many trackers of recent users we reuse
         """
         self.tracking_id = tracking_id
         self.story_tracking_template = story_tracking_template
         self.new_message_tracking_template = new_message_tracking_template
+        self.batch_sender = batch and BatchSender(
+            max_hits=batch_size,
+            max_buffer=batch_buffer_size,
+            flush_interval=batch_flush_interval,
+        ) or None
+        self.dispatcher = queue.Dispatcher(maxsize=queue_size, workers=workers)
+        self.shutdown_timeout = shutdown_timeout
+        self.trackers = lru.LRUCache(max_size=trackers_cache_size)
 
     @staticmethod
     def __hash__():
         return hash('ga.tracker')
 
+    async def start(self):
+        if self.batch_sender:
+            self.batch_sender.start()
+        else:
+            self.dispatcher.start()
+
+    async def stop(self):
+        if self.batch_sender:
+            await self.batch_sender.stop()
+        await self.dispatcher.stop(self.shutdown_timeout)
+
+    def get_metrics(self):
+        if self.batch_sender:
+            return self.batch_sender.get_metrics()
+        return self.dispatcher.get_metrics()
+
     def get_tracker(self, user):
-        logger.debug('get_tracker')
-        logger.debug(Tracker)
-        return Tracker(
-            account=self.tracking_id,
-            client_id=user and user['_id'],
-        )
+        client_id = user and user['_id']
+        if client_id is None:
+            return Tracker(account=self.tracking_id)
+
+        # tracker doesn't keep state of hits so we could reuse it
+        tracker = self.trackers.get(client_id)
+        if tracker is None:
+            logger.debug('create tracker for %s', client_id)
+            tracker = Tracker(
+                account=self.tracking_id,
+                client_id=client_id,
+            )
+            self.trackers.set(client_id, tracker)
+        return tracker
+
+    def send(self, user, hittype, *args):
+        tracker = self.get_tracker(user)
+        if self.batch_sender:
+            self.batch_sender.put(tracker.build_hit(hittype, *args))
+        else:
+            self.dispatcher.dispatch(tracker.send, hittype, *args)
 
     def event(self, user,
               event_category=None,
@@ -49,31 +106,23 @@ class GAStatistics:
               event_label=None,
               event_value=None,
               ):
-        queue.add(
-            functools.partial(self.get_tracker(user).send,
-                              'event', event_category, event_action, event_label, event_value
-                              )
-        )
+        self.send(user,
+                  'event', event_category, event_action, event_label, event_value,
+                  )
 
     def story(self, user, story_name, story_part_name):
-        queue.add(
-            functools.partial(self.get_tracker(user).send,
-                              'pageview', self.story_tracking_template.format(story=story_name,
-                                                                              part=story_part_name),
-                              )
-        )
+        self.send(user,
+                  'pageview', self.story_tracking_template.format(story=story_name,
+                                                                  part=story_part_name),
+                  )
 
     def new_message(self, user, data):
-        queue.add(
-            functools.partial(self.get_tracker(user).send,
-                              'pageview', self.new_message_tracking_template.format(data=json.dumps(data)),
-                              )
-        )
+        self.send(user,
+                  'pageview', self.new_message_tracking_template.format(data=json.dumps(data)),
+                  )
 
     def new_user(self, user):
-        queue.add(
-            functools.partial(self.get_tracker(user).send,
-                              'event',
-                              'new_user', 'start', 'new user starts chat'
-                              )
-        )
+        self.send(user,
+                  'event',
+                  'new_user', 'start', 'new user starts chat'
+                  )
@@ -150,3 +150,68 @@ def test_get_as_deps():
                 self.tracker = tracker
 
         assert isinstance(di.injector.get('one_class').tracker, ga.GAStatistics)
+
+
+@pytest.mark.asyncio
+async def test_send_hits_by_batches():
+    user = utils.build_fake_user()
+    ga = GAStatistics(tracking_id='UA-XXXXX-Y', batch=True, batch_size=2)
+    ga.batch_sender.send_batch = aiohttp.test_utils.make_mocked_coro()
+    await ga.start()
+
+    ga.story(user, 'one story', 'one part')
+    ga.story(user, 'one story', 'two part')
+    await asyncio.sleep(0.1)
+    ga.new_user(user)
+
+    assert ga.batch_sender.send_batch.call_count == 1
+    batch, = ga.batch_sender.send_batch.call_args[0]
+    assert len(batch) == 2
+    assert 'dp=one+story%2Fone+part' in batch[0]
+    assert 'dp=one+story%2Ftwo+part' in batch[1]
+
+    await ga.stop()
+    assert ga.batch_sender.send_batch.call_count == 2
+    batch, = ga.batch_sender.send_batch.call_args[0]
+    assert 'ec=new_user' in batch[0]
+
+
+@pytest.mark.asyncio
+async def test_send_the_rest_of_hits_on_stop(tracker_mock):
+    user = utils.build_fake_user()
+    ga = GAStatistics(tracking_id='UA-XXXXX-Y')
+    await ga.start()
+
+    ga.new_user(user)
+    await ga.stop()
+
+    tracker_mock.send.assert_called_once_with(
+        'event',
+        'new_user', 'start', 'new user starts chat'
+    )
+    assert ga.get_metrics()['processed'] == 1
+
+
+def test_reuse_tracker_of_the_same_user():
+    user = utils.build_fake_user()
+    ga = GAStatistics(tracking_id='UA-XXXXX-Y')
+
+    assert ga.get_tracker(user) is ga.get_tracker(user)
+    assert ga.get_tracker(user) is not ga.get_tracker(utils.build_fake_user())
+    assert ga.get_tracker(None) is not ga.get_tracker(None)
+
+
+def test_build_hit_with_persistent_params():
+    ga = GAStatistics(tracking_id='UA-XXXXX-Y')
+    hit = ga.get_tracker({'_id': 123}).build_hit('event', 'category', 'action', 'label', 10)
+
+    assert hit == {
+        'v': 1,
+        'tid': 'UA-XXXXX-Y',
+        'cid': '123',
+        't': 'event',
+        'ec': 'category',
+        'ea': 'action',
+        'el': 'label',
+        'ev': 10,
+    }
@@ -0,0 +1,166 @@
+"""
+Buffered delivery of hits through the measurement protocol /batch endpoint
+
+More: https://developers.google.com/analytics/devguides/collection/protocol/v1/devguide#batch
+"""
+
+import aiohttp
+import asyncio
+import collections
+import logging
+from urllib.parse import urlencode
+
+logger = logging.getLogger(__name__)
+
+# limits of /batch endpoint
+MAX_HITS_PER_BATCH = 20
+MAX_BATCH_BYTES = 16 * 1024
+MAX_HIT_BYTES = 8 * 1024
+
+
+class BatchSender:
+    """
+    accumulates hits and sends them by batches
+    once we have enough of them or once in flush_interval seconds.
+
+    buffer is bounded so the oldest hits are dropped on overflow
+    """
+
+    endpoint = 'https://www.google-analytics.com/batch'
+
+    def __init__(self,
+                 max_hits=MAX_HITS_PER_BATCH,
+                 max_buffer=1000,
+                 flush_interval=1.0,
+                 user_agent=None):
+        """
+
+        :param max_hits: max number of hits in one request
+        :param max_buffer: max number of waiting hits
+        :param flush_interval: how often (in seconds) we send what we have
+        :param user_agent:
+        """
+        self.max_hits = min(max_hits, MAX_HITS_PER_BATCH)
+        self.flush_interval = flush_interval
+        self.user_agent = user_agent or 'Bot Story'
+        self.hits = collections.deque(maxlen=max_buffer)
+
+        # for debug purpose
+        self._session = None
+        self.client_session = None
+        # created once we have running loop
+        self.flush_lock = None
+        self.flusher = None
+        # flush which has been scheduled once buffer is full
+        self.pending_flush = None
+
+        self.received = 0
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+        self.requests = 0
+
+    def put(self, hit):
+        """
+        add hit to the buffer
+
+        :param hit: parameters of hit (Tracker.build_hit)
+        """
+        line = urlencode(hit)
+        if len(line.encode('utf-8')) > MAX_HIT_BYTES:
+            logger.warning('drop too large hit {}'.format(line[:100]))
+            self.dropped += 1
+            return
+        if len(self.hits) == self.hits.maxlen:
+            self.dropped += 1
+        self.hits.append(line)
+        self.received += 1
+        if len(self.hits) >= self.max_hits and \
+                not (self.pending_flush and not self.pending_flush.done()) and \
+                not (self.flush_lock and self.flush_lock.locked()):
+            self.pending_flush = asyncio.ensure_future(self.flush())
+
+    def get_flush_lock(self):
+        if self.flush_lock is None:
+            self.flush_lock = asyncio.Lock()
+        return self.flush_lock
+
+    def take_batch(self):
+        batch = []
+        size = 0
+        while self.hits and len(batch) < self.max_hits:
+            line_size = len(self.hits[0].encode('utf-8')) + 1
+            if batch and size + line_size > MAX_BATCH_BYTES:
+                break
+            batch.append(self.hits.popleft())
+            size += line_size
+        return batch
+
+    async def flush(self):
+        """
+        send everything we have in buffer
+        """
+        async with self.get_flush_lock():
+            while self.hits:
+                batch = self.take_batch()
+                try:
+                    await self.send_batch(batch)
+                    self.sent += len(batch)
+                except Exception as err:
+                    logger.warning('fail on send batch of hits: {}'.format(err))
+                    self.failed += len(batch)
+
+    async def send_batch(self, batch):
+        self.requests += 1
+        session = self.get_client_session()
+        async with session.post(self.endpoint,
+                                data='\n'.join(batch).encode('utf-8'),
+                                headers={
+                                    'User-Agent': self.user_agent,
+                                }) as resp:
+            logger.debug('batch status {}'.format(resp.status))
+
+    def get_client_session(self):
+        if self._session:
+            return self._session
+        if not self.client_session:
+            self.client_session = aiohttp.ClientSession()
+        return self.client_session
+
+    async def flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        self.get_flush_lock()
+        if not self.flusher:
+            self.flusher = asyncio.ensure_future(self.flush_periodically())
+
+    async def stop(self):
+        if self.flusher:
+            self.flusher.cancel()
+            try:
+                await self.flusher
+            except asyncio.CancelledError:
+                pass
+            self.flusher = None
+
+        await self.flush()
+
+        if self.client_session:
+            res = self.client_session.close()
+            if asyncio.iscoroutine(res):
+                await res
+            self.client_session = None
+
+    def get_metrics(self):
+        return {
+            'depth': len(self.hits),
+            'max_buffer': self.hits.maxlen,
+            'received': self.received,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'requests': self.requests,
+        }
@@ -0,0 +1,75 @@
+import asyncio
+import aiohttp
+import pytest
+
+from . import batch
+
+
+@pytest.fixture
+def sender():
+    s = batch.BatchSender(max_hits=20, max_buffer=3)
+    s.send_batch = aiohttp.test_utils.make_mocked_coro()
+    return s
+
+
+@pytest.mark.asyncio
+async def test_drop_the_oldest_hits_on_overflow(sender):
+    for i in range(5):
+        sender.put({'t': 'pageview', 'dp': '/{}'.format(i)})
+
+    assert sender.get_metrics()['dropped'] == 2
+    await sender.flush()
+    sender.send_batch.assert_called_once_with([
+        't=pageview&dp=%2F2',
+        't=pageview&dp=%2F3',
+        't=pageview&dp=%2F4',
+    ])
+
+
+@pytest.mark.asyncio
+async def test_split_hits_to_batches_by_size(sender):
+    sender.hits = batch.collections.deque(maxlen=100)
+    for i in range(3):
+        sender.put({'dp': 'x' * 7000})
+
+    await sender.flush()
+    assert sender.send_batch.call_count == 2
+    assert sender.get_metrics()['sent'] == 3
+
+
+@pytest.mark.asyncio
+async def test_schedule_only_one_flush_once_buffer_is_full():
+    sender = batch.BatchSender(max_hits=2, max_buffer=100)
+    sender.send_batch = aiohttp.test_utils.make_mocked_coro()
+    flush = sender.flush
+    flushes = []
+
+    async def count_flush():
+        flushes.append(True)
+        await flush()
+
+    sender.flush = count_flush
+    for i in range(10):
+        sender.put({'t': 'event', 'ev': i})
+    await asyncio.sleep(0)
+
+    assert len(flushes) == 1
+    assert sender.send_batch.call_count == 5
+    assert sender.get_metrics()['sent'] == 10
+
+    sender.put({'t': 'event'})
+    sender.put({'t': 'event'})
+    await asyncio.sleep(0)
+
+    assert len(flushes) == 2
+    assert sender.get_metrics()['sent'] == 12
+
+
+@pytest.mark.asyncio
+async def test_flush_on_stop(sender):
+    sender.start()
+    sender.put({'t': 'event'})
+    await sender.stop()
+
+    sender.send_batch.assert_called_once_with(['t=event'])
+    assert sender.flusher is None
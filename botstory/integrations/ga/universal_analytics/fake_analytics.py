@@ -22,3 +22,7 @@ class FakeAnalytics(FakeServer):
     @post('/collect')
     async def on_my_friends(self, request):
         return web.json_response({})
+
+    @post('/batch')
+    async def on_batch(self, request):
+        return web.json_response({})
@@ -156,11 +156,15 @@ class Tracker:
             raise KeyError('Parameter "{0}" is not recognized'.format(name))
 
     def payload(self, data):
+        # the same as coerceParameter but without exceptions for unknown parameters
+        parameter_alias = self.parameter_alias
         for key, value in data.items():
-            try:
-                yield self.coerceParameter(key, value)
-            except KeyError:
-                continue
+            alias = parameter_alias.get(key, None)
+            if alias is not None:
+                typecast, param_name = alias
+                yield param_name, typecast(value)
+            elif isinstance(key, str) and key[:1] == '&':
+                yield key[1:], str(value)
 
     option_sequence = {
         'pageview': [(str, 'dp')],
@@ -203,17 +207,20 @@ class Tracker:
         else:
             self.http = HTTPPost(user_agent=user_agent)
 
-        self.params = {'v': 1, 'tid': account}
+        params = {'v': 1, 'tid': account}
 
         if client_id is None:
             client_id = generate_uuid()
 
-        self.params['cid'] = client_id
+        params['cid'] = client_id
 
         self.hash_client_id = hash_client_id
 
         if user_id is not None:
-            self.params['uid'] = user_id
+            params['uid'] = user_id
+
+        # persistent parameters are coerced once so we don't repeat it for each hit
+        self.params = dict(self.payload(params))
 
     def set_timestamp(self, data):
         """ Interpret time-related options, apply queue-time parameter as needed """
@@ -224,6 +231,11 @@ class Tracker:
 
     async def send(self, hittype, *args, **data):
         """ Transmit HTTP requests to Google Analytics using the measurement protocol """
+        # Transmit the hit to Google...
+        await self.http.send(self.build_hit(hittype, *args, **data))
+
+    def build_hit(self, hittype, *args, **data):
+        """ Build parameters of hit in terms of the measurement protocol """
 
         if hittype not in self.valid_hittypes:
             raise KeyError('Unsupported Universal Analytics Hit Type: {0}'.format(repr(hittype)))
@@ -236,17 +248,16 @@ class Tracker:
                 for key, val in self.payload(item):
                     data[key] = val
 
+        data = dict(self.payload(data))
+
         for k, v in self.params.items():  # update only absent parameters
             if k not in data:
                 data[k] = v
 
-        data = dict(self.payload(data))
-
         if self.hash_client_id:
             data['cid'] = generate_uuid(data['cid'])
 
-        # Transmit the hit to Google...
-        await self.http.send(data)
+        return data
 
     # Setting persistent attibutes of the session/hit/etc (inc. custom dimensions/metrics)
     def set(self, name, value=None):
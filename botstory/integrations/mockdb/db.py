@@ -1,5 +1,8 @@
 import aiohttp
+# test_utils is a submodule which aiohttp does not import itself
+import aiohttp.test_utils
 from ... import di, utils
+from ...utils import broadcast
 
 
 @di.desc('storage', reg=False)
@@ -27,3 +30,14 @@ class MockDB:
     async def new_user(self, **kwargs):
         self.user = utils.JSDict({**kwargs})
         return self.user
+
+    def iter_users(self, **kwargs):
+        return broadcast.AsyncIterator([self.user] if self.user else [])
+
+    async def get_user_and_session(self, **kwargs):
+        return await self.get_user(**kwargs), await self.get_session(**kwargs)
+
+    async def new_user_and_session(self, facebook_user_id, **kwargs):
+        user = await self.new_user(facebook_user_id=facebook_user_id, **kwargs)
+        session = await self.new_session(facebook_user_id=facebook_user_id, stack=[], user=user)
+        return user, session
@@ -16,3 +16,13 @@ def test_get_mockdb_as_dep():
                 self.storage = storage
 
         assert isinstance(di.injector.get('one_class').storage, mockdb.MockDB)
+
+
+@pytest.mark.asyncio
+async def test_get_user_and_session_at_once():
+    db = mockdb.MockDB()
+    user, session = await db.new_user_and_session('1234567890', first_name='Alice')
+    assert session['user'] == user
+
+    restored_user, _ = await db.get_user_and_session(facebook_user_id='1234567890')
+    assert restored_user == user
@@ -1,6 +1,8 @@
 import asyncio
+from bson.objectid import ObjectId
 import logging
 from motor import motor_asyncio
+from pymongo import ReturnDocument
 from ... import di
 
 logger = logging.getLogger(__name__)
@@ -38,6 +40,18 @@ class MongodbInterface:
         logger.debug(' get session collection: {}'.format(self.session_collection_name))
         self.user_collection = self.db.get_collection(self.user_collection_name)
         logger.debug(' get user collection: {}'.format(self.user_collection_name))
+        await self.ensure_indexes()
+
+    async def ensure_indexes(self):
+        """
+        each lookup of user and session filters by these fields
+        """
+        logger.debug(' ensure indexes')
+        await asyncio.gather(
+            self.user_collection.create_index('facebook_user_id'),
+            self.session_collection.create_index('user_id'),
+            self.session_collection.create_index('facebook_user_id'),
+        )
 
     async def stop(self):
         self.cx = None
@@ -50,26 +64,32 @@ class MongodbInterface:
         self.session_collection = self.db.get_collection(self.session_collection_name)
         await self.user_collection.drop()
         self.user_collection = self.db.get_collection(self.user_collection_name)
+        await self.ensure_indexes()
 
     async def get_session(self, **kwargs):
         return await self.session_collection.find_one(kwargs)
 
     async def set_session(self, session):
-        old_session = await self.session_collection.find_one({'user_id': session['user_id']})
-        logger.debug('old_session')
-        logger.debug(old_session)
-        if not old_session:
-            res = await self.session_collection.insert(session)
-        else:
-            res = await self.session_collection.update({'user_id': session['user_id']}, session)
-
-        return res
+        doc = await self.session_collection.find_one_and_update(
+            {'user_id': session['user_id']},
+            build_upsert(without_id(session)),
+            projection={'_id': True},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if not get_id(session):
+            session['_id'] = doc['_id']
+        return doc['_id']
 
     async def new_session(self, user, **kwargs):
         kwargs['user_id'] = kwargs.get('user_id', user['_id'])
         kwargs['stack'] = kwargs.get('stack', [])
-        id = await self.session_collection.insert(kwargs)
-        return await self.session_collection.find_one({'_id': id})
+        return await self.session_collection.find_one_and_update(
+            {'user_id': kwargs['user_id']},
+            {'$set': kwargs},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
 
     async def get_user(self, **kwargs):
         if 'id' in kwargs:
@@ -78,13 +98,105 @@ class MongodbInterface:
         return await self.user_collection.find_one(kwargs)
 
     async def set_user(self, user):
-        if not getattr(user, '_id', None):
-            res = await self.user_collection.insert(user)
-        else:
-            res = await self.user_collection.update({'_id': user._id}, user)
-        return res
+        if not get_id(user):
+            # as insert did, so the next save updates the same document
+            user['_id'] = ObjectId()
+        doc = await self.user_collection.find_one_and_update(
+            {'_id': user['_id']},
+            build_upsert(without_id(user), {'_id': user['_id']}),
+            projection={'_id': True},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return doc['_id']
 
     async def new_user(self, **kwargs):
         logger.debug('store new user {}'.format(kwargs))
-        id = await self.user_collection.insert(kwargs)
-        return await self.user_collection.find_one({'_id': id})
+        user_id = kwargs.get('_id', None) or ObjectId()
+        if 'facebook_user_id' in kwargs:
+            # don't create the same user twice
+            query = {'facebook_user_id': kwargs['facebook_user_id']}
+        else:
+            query = {'_id': user_id}
+        return await self.user_collection.find_one_and_update(
+            query,
+            build_upsert(without_id(kwargs), {'_id': user_id}),
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def iter_users(self, batch_size=1000, projection=None, **kwargs):
+        """
+        stream users which match query.
+        cursor fetches them by batches so we don't load all of them at once
+
+            async for user in db.iter_users():
+                ...
+
+        :param batch_size: number of users in one batch
+        :param projection: (optional) fields of user which we need
+        :param kwargs: query
+        :return: async iterable cursor
+        """
+        return self.user_collection.find(kwargs, projection, batch_size=batch_size)
+
+    async def get_user_and_session(self, **kwargs):
+        """
+        fetch user and its session concurrently
+
+        :param kwargs: query (for example facebook_user_id)
+        :return: (user, session)
+        """
+        user, session = await asyncio.gather(
+            self.get_user(**kwargs),
+            self.get_session(**kwargs),
+        )
+        return user, session
+
+    async def new_user_and_session(self, facebook_user_id, **kwargs):
+        """
+        create user and its empty session concurrently.
+        we know id of user before it is stored so we don't need to wait for it
+
+        :param facebook_user_id:
+        :param kwargs: fields of user
+        :return: (user, session)
+        """
+        user_id = ObjectId()
+        user, session = await asyncio.gather(
+            self.new_user(_id=user_id, facebook_user_id=facebook_user_id, **kwargs),
+            self.new_session(user={'_id': user_id}, facebook_user_id=facebook_user_id, stack=[]),
+        )
+        if user['_id'] != user_id:
+            # user has already been stored before
+            await self.session_collection.delete_one({'user_id': user_id})
+            session = await self.new_session(user=user, facebook_user_id=facebook_user_id, stack=[])
+        return user, session
+
+
+def get_id(document):
+    try:
+        return document['_id']
+    except KeyError:
+        return None
+
+
+def without_id(document):
+    return {key: value for key, value in document.items() if key != '_id'}
+
+
+def build_upsert(fields, on_insert=None):
+    """
+    update document of upsert.
+    mongodb rejects empty $set so we skip it once there is nothing to set
+
+    :param fields: fields which we set on each save
+    :param on_insert: (optional) fields which we set only on insert
+    :return:
+    """
+    update = {}
+    if fields:
+        update['$set'] = fields
+    if on_insert:
+        update['$setOnInsert'] = on_insert
+    return update
@@ -89,6 +89,35 @@ async def test_store_restore_user(open_db):
         assert user.items() == restored_user.items()
 
 
+@pytest.mark.asyncio
+async def test_save_the_same_new_user_twice(open_db):
+    async with open_db() as db_interface:
+        user = utils.build_fake_user()
+        del user['_id']
+
+        user_id = await db_interface.set_user(user)
+        user['name'] = 'Bob'
+        assert await db_interface.set_user(user) == user_id
+
+        assert await db_interface.user_collection.count({}) == 1
+        restored_user = await db_interface.get_user(id=user_id)
+        assert restored_user['name'] == 'Bob'
+
+
+@pytest.mark.asyncio
+async def test_save_user_without_fields(open_db):
+    async with open_db() as db_interface:
+        user = {}
+        user_id = await db_interface.set_user(user)
+        assert user['_id'] == user_id
+        assert await db_interface.set_user(user) == user_id
+
+        new_user = await db_interface.new_user()
+        assert new_user['_id']
+
+        assert await db_interface.user_collection.count({}) == 2
+
+
 @pytest.mark.asyncio
 async def test_create_new_session(open_db):
     async with open_db() as db_interface:
@@ -107,6 +136,76 @@ async def test_create_new_user(open_db):
         assert user['facebook_user_id'] == '1234567890'
 
 
+@pytest.mark.asyncio
+async def test_update_the_same_session(open_db):
+    async with open_db() as db_interface:
+        session = utils.build_fake_session()
+        session_id = await db_interface.set_session(session)
+
+        session['stack'] = [{'data': None, 'step': 1, 'topic': 'one_story'}]
+        assert await db_interface.set_session(session) == session_id
+
+        assert await db_interface.session_collection.count() == 1
+        restored_session = await db_interface.get_session(user_id=session['user_id'])
+        assert restored_session['stack'] == session['stack']
+
+
+@pytest.mark.asyncio
+async def test_do_not_create_the_same_user_twice(open_db):
+    async with open_db() as db_interface:
+        user = await db_interface.new_user(facebook_user_id='1234567890', first_name='Alice')
+        same_user = await db_interface.new_user(facebook_user_id='1234567890', first_name='Alice')
+        assert user['_id'] == same_user['_id']
+        assert await db_interface.user_collection.count() == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_users(open_db):
+    async with open_db() as db_interface:
+        for idx in range(5):
+            await db_interface.new_user(facebook_user_id=str(idx), locale='en_US' if idx % 2 else 'uk_UA')
+
+        facebook_user_ids = []
+        async for user in db_interface.iter_users(batch_size=2, locale='en_US'):
+            facebook_user_ids.append(user['facebook_user_id'])
+
+        assert sorted(facebook_user_ids) == ['1', '3']
+
+
+@pytest.mark.asyncio
+async def test_create_new_user_and_session_at_once(open_db):
+    async with open_db() as db_interface:
+        user, session = await db_interface.new_user_and_session('1234567890', first_name='Alice')
+        assert session['user_id'] == user['_id']
+
+        restored_user, restored_session = await db_interface.get_user_and_session(
+            facebook_user_id='1234567890')
+        assert restored_user['first_name'] == 'Alice'
+        assert restored_session['user_id'] == user['_id']
+        assert restored_session['stack'] == []
+
+
+@pytest.mark.asyncio
+async def test_link_session_to_already_stored_user(open_db):
+    async with open_db() as db_interface:
+        user = await db_interface.new_user(facebook_user_id='1234567890')
+        same_user, session = await db_interface.new_user_and_session('1234567890')
+        assert same_user['_id'] == user['_id']
+        assert session['user_id'] == user['_id']
+        assert await db_interface.session_collection.count() == 1
+
+
+@pytest.mark.asyncio
+async def test_ensure_indexes_on_start(open_db):
+    async with open_db() as db_interface:
+        user_indexes = await db_interface.user_collection.index_information()
+        session_indexes = await db_interface.session_collection.index_information()
+
+        assert [('facebook_user_id', 1)] in [i['key'] for i in user_indexes.values()]
+        assert [('user_id', 1)] in [i['key'] for i in session_indexes.values()]
+        assert [('facebook_user_id', 1)] in [i['key'] for i in session_indexes.values()]
+
+
 @pytest.mark.asyncio
 async def test_start_should_open_connection_and_close_on_stop():
     db_interface = db.MongodbInterface(uri=os.environ.get('TEST_MONGODB_URL', 'mongo'), db_name='test')
@@ -0,0 +1,174 @@
+import bisect
+import logging
+import re
+
+from ... import di
+
+logger = logging.getLogger(__name__)
+
+# default buckets of prometheus client (in seconds)
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+CONTENT_TYPE = 'text/plain'
+
+INVALID_NAME_CHARS = re.compile(r'[^a-zA-Z0-9_:]')
+
+
+def labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, escape_label_value(value))
+                          for name, value in items) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        :return: list of (upper bound, number of values less or equal to it)
+        """
+        res = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            res.append((bound, total))
+        return res
+
+
+@di.desc('metrics', reg=False)
+class PrometheusMetrics:
+    """
+    in-process counters and timing histograms of pipeline stages
+    which are exposed in Prometheus text format.
+
+    processor, interfaces and chat measure time only once
+    metrics have been registered so it doesn't cost anything until we use it:
+
+        story.use(PrometheusMetrics(uri='/metrics'))
+    """
+
+    def __init__(self, uri=None, prefix='botstory', buckets=DEFAULT_BUCKETS):
+        """
+
+        :param uri: (optional) path of exporter on AioHttpInterface
+        :param prefix: prefix of names of all metrics
+        :param buckets: upper bounds (in seconds) of buckets of histograms
+        """
+        self.uri = uri
+        self.prefix = prefix
+        self.buckets = tuple(sorted(buckets))
+        self.http = None
+        # name -> labels key -> value
+        self.counters = {}
+        # name -> labels key -> Histogram
+        self.histograms = {}
+
+    @di.inject()
+    def add_http(self, http):
+        logger.debug('add_http')
+        logger.debug(http)
+        self.http = http
+
+    async def before_start(self):
+        if self.uri and self.http:
+            self.http.add_get(self.uri, self.handle_export)
+
+    def increment(self, name, value=1, **labels):
+        """
+        increment counter
+
+        :param name: name of counter (without prefix and _total suffix)
+        :param value:
+        :param labels:
+        """
+        counter = self.counters.setdefault(name, {})
+        key = labels_key(labels)
+        counter[key] = counter.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """
+        add value (usually duration in seconds) to histogram
+
+        :param name: name of histogram (without prefix)
+        :param value:
+        :param labels:
+        """
+        histogram = self.histograms.setdefault(name, {})
+        key = labels_key(labels)
+        try:
+            histogram[key].observe(value)
+        except KeyError:
+            histogram[key] = Histogram(self.buckets)
+            histogram[key].observe(value)
+
+    def get_counter(self, name, **labels):
+        return self.counters.get(name, {}).get(labels_key(labels), 0)
+
+    def get_histogram(self, name, **labels):
+        return self.histograms.get(name, {}).get(labels_key(labels), None)
+
+    def clear(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def full_name(self, name):
+        name = INVALID_NAME_CHARS.sub('_', name)
+        return '{}_{}'.format(self.prefix, name) if self.prefix else name
+
+    def to_text(self):
+        """
+        render metrics in Prometheus text exposition format
+
+        :return:
+        """
+        lines = []
+        for name, values in sorted(self.counters.items()):
+            full_name = self.full_name(name) + '_total'
+            lines.append('# TYPE {} counter'.format(full_name))
+            for key, value in sorted(values.items()):
+                lines.append('{}{} {}'.format(full_name, format_labels(key), format_value(value)))
+
+        for name, values in sorted(self.histograms.items()):
+            full_name = self.full_name(name)
+            lines.append('# TYPE {} histogram'.format(full_name))
+            for key, histogram in sorted(values.items()):
+                for bound, count in histogram.cumulative():
+                    lines.append('{}_bucket{} {}'.format(
+                        full_name,
+                        format_labels(key, [('le', format_value(bound))]),
+                        count))
+                lines.append('{}_sum{} {}'.format(full_name, format_labels(key), format_value(histogram.sum)))
+                lines.append('{}_count{} {}'.format(full_name, format_labels(key), histogram.count))
+
+        return '\n'.join(lines) + '\n'
+
+    async def handle_export(self):
+        return {
+            'text': self.to_text(),
+            'content_type': CONTENT_TYPE,
+        }
@@ -0,0 +1,126 @@
+import pytest
+
+from . import PrometheusMetrics
+from .. import fb, mockdb, mockhttp
+from ... import di, Story, utils
+from ...middlewares import text
+
+story = None
+
+
+def teardown_function(function):
+    story and story.clear()
+
+
+def test_render_counters_and_histograms():
+    metrics = PrometheusMetrics(buckets=(0.1, 1))
+    metrics.increment('messages')
+    metrics.increment('messages')
+    metrics.observe('stage_seconds', 0.05, stage='dispatch')
+    metrics.observe('stage_seconds', 0.5, stage='dispatch')
+    metrics.observe('stage_seconds', 5, stage='dispatch')
+
+    assert metrics.to_text() == '\n'.join([
+        '# TYPE botstory_messages_total counter',
+        'botstory_messages_total 2.0',
+        '# TYPE botstory_stage_seconds histogram',
+        'botstory_stage_seconds_bucket{stage="dispatch",le="0.1"} 1',
+        'botstory_stage_seconds_bucket{stage="dispatch",le="1.0"} 2',
+        'botstory_stage_seconds_bucket{stage="dispatch",le="+Inf"} 3',
+        'botstory_stage_seconds_sum{stage="dispatch"} 5.55',
+        'botstory_stage_seconds_count{stage="dispatch"} 3',
+    ]) + '\n'
+
+
+def test_escape_values_of_labels():
+    metrics = PrometheusMetrics()
+    metrics.increment('messages', topic='say "hi"\n')
+    assert 'botstory_messages_total{topic="say \\"hi\\"\\n"} 1.0' in metrics.to_text()
+
+
+@pytest.mark.asyncio
+async def test_measure_stages_of_pipeline():
+    global story
+    story = Story()
+
+    @story.on(text.Match('hi'))
+    def greeting_story():
+        @story.part()
+        async def greet(message):
+            return await story.ask('how are you?', user=message['user'])
+
+        @story.part()
+        def done(message):
+            pass
+
+    metrics = story.use(PrometheusMetrics())
+    interface = story.use(fb.FBInterface(page_access_token='qwerty'))
+    story.use(mockdb.MockDB())
+    story.use(mockhttp.MockHttpInterface())
+    await story.start()
+
+    await interface.handle({
+        'object': 'page',
+        'entry': [{
+            'id': 'PAGE_ID',
+            'time': 1473204787206,
+            'messaging': [{
+                'sender': {'id': 'USER_ID'},
+                'recipient': {'id': 'PAGE_ID'},
+                'timestamp': 1458692752478,
+                'message': {'text': 'hi'},
+            }],
+        }],
+    })
+
+    assert metrics.get_counter('messages') == 1
+    for stage in ('webhook', 'storage_read', 'profile', 'session_lock',
+                  'match_message', 'dispatch', 'send', 'storage_write'):
+        assert metrics.get_histogram('stage_seconds', stage=stage).count == 1
+    assert metrics.get_histogram('story_part_seconds',
+                                 topic='greeting_story',
+                                 part='greet').count == 1
+
+
+@pytest.mark.asyncio
+async def test_count_unmatched_messages():
+    global story
+    story = Story()
+    metrics = story.use(PrometheusMetrics())
+    await story.start()
+
+    user = utils.build_fake_user()
+    await story.match_message({
+        'data': {'text': {'raw': 'hi'}},
+        'session': utils.build_fake_session(user),
+        'user': user,
+    })
+
+    assert metrics.get_counter('unmatched_messages') == 1
+
+
+@pytest.mark.asyncio
+async def test_mount_exporter_on_http():
+    global story
+    story = Story()
+    metrics = story.use(PrometheusMetrics(uri='/metrics'))
+    http = story.use(mockhttp.MockHttpInterface())
+    await story.start()
+
+    http.add_get.assert_called_once_with('/metrics', metrics.handle_export)
+    res = await metrics.handle_export()
+    assert res['content_type'] == 'text/plain'
+
+
+def test_get_as_deps():
+    global story
+    story = Story()
+    story.use(PrometheusMetrics())
+
+    @di.desc()
+    class OneClass:
+        @di.inject()
+        def deps(self, metrics):
+            self.metrics = metrics
+
+    assert isinstance(di.injector.get('one_class').metrics, PrometheusMetrics)
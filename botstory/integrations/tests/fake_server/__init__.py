@@ -1 +1,2 @@
 from .fake_fb import *
+from .fake_graph_api import *
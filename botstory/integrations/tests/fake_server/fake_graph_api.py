@@ -0,0 +1,145 @@
+"""
+configurable local stand-in of Graph API
+to benchmark outgoing path (FBInterface -> AioHttpInterface)
+
+    async with FakeGraphAPI(loop, latency=0.05, rate_limit_rate=0.01) as server:
+        story.use(AioHttpInterface(resolver=server.resolver, verify_ssl=False))
+"""
+
+import asyncio
+import collections
+from aiohttp import web
+import logging
+import random
+
+from .server import FakeServer, get, post, delete
+
+logger = logging.getLogger(__name__)
+
+
+class FakeGraphAPI(FakeServer):
+    ROOT_URI = 'graph.facebook.com'
+
+    def __init__(self, loop,
+                 latency=0,
+                 latency_jitter=0,
+                 error_rate=0,
+                 rate_limit_rate=0,
+                 retry_after=1,
+                 seed=None,
+                 keep_history=False):
+        """
+
+        :param loop:
+        :param latency: delay (in seconds) before each response
+        :param latency_jitter: max random deviation of latency
+        :param error_rate: share (0..1) of requests which fail with 500
+        :param rate_limit_rate: share (0..1) of requests which fail with 429
+        :param retry_after: value of Retry-After header of 429 responses
+        :param seed: seed of random so runs are reproducible
+        :param keep_history: store all requests and responses
+        """
+        super().__init__(loop, keep_history=keep_history)
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+
+        self.requests = 0
+        self.statuses = collections.Counter()
+        # peer (host, port) -> number of requests
+        # each client connection has its own port
+        self.connections = collections.Counter()
+
+    def get_metrics(self):
+        connections = len(self.connections)
+        return {
+            'requests': self.requests,
+            'statuses': {str(status): count for status, count in self.statuses.items()},
+            'connections': connections,
+            'requests_per_connection': self.requests / connections if connections else None,
+        }
+
+    async def respond(self, request, body):
+        """
+        emulate latency and failures of real server
+
+        :param request:
+        :param body: payload of successful response
+        :return:
+        """
+        self.requests += 1
+        peer = request.transport.get_extra_info('peername') if request.transport else None
+        self.connections[peer] += 1
+
+        delay = self.latency
+        if self.latency_jitter:
+            delay += self.random.uniform(-self.latency_jitter, self.latency_jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        dice = self.random.random()
+        if dice < self.rate_limit_rate:
+            response = web.json_response({
+                'error': {
+                    'message': '(#4) Application request limit reached',
+                    'type': 'OAuthException',
+                    'code': 4,
+                },
+            }, status=429, headers={
+                'Retry-After': str(self.retry_after),
+            })
+        elif dice < self.rate_limit_rate + self.error_rate:
+            response = web.json_response({
+                'error': {
+                    'message': 'An unexpected error has occurred. Please retry your request later.',
+                    'type': 'OAuthException',
+                    'code': 2,
+                    'is_transient': True,
+                },
+            }, status=500)
+        else:
+            response = web.json_response(body)
+
+        self.statuses[response.status] += 1
+        return response
+
+    async def on_messages(self, request):
+        data = await request.json()
+        return await self.respond(request, {
+            'recipient_id': data['recipient']['id'],
+            'message_id': 'mid.{}'.format(self.requests),
+        })
+
+    @post('/v2.6/me/messages')
+    async def on_messages_without_slash(self, request):
+        return await self.on_messages(request)
+
+    @post('/v2.6/me/messages/')
+    async def on_messages_with_slash(self, request):
+        return await self.on_messages(request)
+
+    @get('/v2.6/{user_id}')
+    async def on_profile(self, request):
+        return await self.respond(request, {
+            'first_name': 'John',
+            'last_name': 'Doe',
+            'profile_pic': 'https://fbcdn-profile-a.akamaihd.net/hprofile-ak-xpf1/v/t1.0-1/p200x200/13055603_10105219398495383_8237637584159975445_n.jpg',
+            'locale': 'en_US',
+            'timezone': 2,
+            'gender': 'male',
+        })
+
+    @post('/v2.6/me/thread_settings')
+    async def on_thread_settings_post(self, request):
+        return await self.respond(request, {
+            'result': 'Successfully updated thread settings',
+        })
+
+    @delete('/v2.6/me/thread_settings')
+    async def on_thread_settings_delete(self, request):
+        return await self.respond(request, {
+            'result': 'Successfully deleted thread settings',
+        })
@@ -80,10 +80,18 @@ class FakeResolver:
 
 
 class FakeServer:
-    def __init__(self, loop):
+    def __init__(self, loop, keep_history=True):
+        """
+
+        :param loop:
+        :param keep_history: store all requests and responses
+        (turn off for long runs)
+        """
         self.loop = loop
         self.port = None
         self.history = []
+        self.keep_history = keep_history
+        self.resolver = None
 
         self.app = web.Application(loop=loop)
         for name in dir(self.__class__):
@@ -108,10 +116,11 @@ class FakeServer:
             logger.debug('request: {}'.format(request))
             logger.debug('response: {}'.format(response))
 
-            self.history.append({
-                'request': request,
-                'response': response,
-            })
+            if self.keep_history:
+                self.history.append({
+                    'request': request,
+                    'response': response,
+                })
             return response
 
         return middleware
@@ -135,9 +144,9 @@ class FakeServer:
 
     async def __aenter__(self):
         info = await self.start()
-        resolver = FakeResolver(info, loop=self.loop)
+        self.resolver = FakeResolver(info, loop=self.loop)
         self.connector = aiohttp.TCPConnector(loop=self.loop,
-                                              resolver=resolver,
+                                              resolver=self.resolver,
                                               verify_ssl=False)
         return self
 
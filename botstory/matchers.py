@@ -1,5 +1,11 @@
+from .utils import lru
+
 matchers = {}
 
+# deserialized validators are shared between sessions
+# so validator shouldn't change its state
+cache = lru.LRUCache(max_size=10000)
+
 
 def build_serializer():
     def default_serialize(_):
@@ -9,8 +15,14 @@ def build_serializer():
 
 
 def build_deserialize(cls):
+    # matcher without state could be the single instance (flyweight)
+    instance = None
+
     def default_deserialize(data):
-        return cls()
+        nonlocal instance
+        if instance is None:
+            instance = cls()
+        return instance
 
     return default_deserialize
 
@@ -50,5 +62,42 @@ def serialize(m):
 
 
 def deserialize(data):
+    """
+    get validator from its serialized form.
+    the same serialized forms get the same (cached) validator
+
+    :param data:
+    :return:
+    """
+    try:
+        key = freeze(data)
+        validator = cache.get(key)
+    except TypeError:
+        # unhashable part of data
+        return _deserialize(data)
+
+    if validator is None:
+        validator = _deserialize(data)
+        cache.set(key, validator)
+    return validator
+
+
+def _deserialize(data):
     matcher_type = matchers[data['type']]
     return matcher_type.deserialize(data['data'])
+
+
+def freeze(data):
+    """
+    hashable copy of serialized data.
+    we keep type of each value so 1, 1.0 and True don't collide
+
+    :param data:
+    :return:
+    """
+    data_type = type(data)
+    if data_type is dict:
+        return data_type, tuple((freeze(key), freeze(value)) for key, value in data.items())
+    if data_type is list or data_type is tuple:
+        return data_type, tuple(freeze(value) for value in data)
+    return data_type, data
@@ -0,0 +1,36 @@
+from . import matchers
+from .ast import forking
+from .middlewares import any, option, text
+
+
+def test_share_validators_of_the_same_serialized_form():
+    data = matchers.serialize(any.AnyOf([text.Match('hi'), option.Match('GREETING')]))
+
+    assert matchers.deserialize(data) is matchers.deserialize(data)
+    assert matchers.deserialize(matchers.serialize(text.Match('hi'))) is \
+           matchers.deserialize(data).list_of_matchers[0]
+
+
+def test_matcher_without_state_is_flyweight():
+    assert matchers.deserialize(matchers.serialize(text.Any())) is \
+           matchers.deserialize({'type': 'text.Any', 'data': None})
+
+
+def test_do_not_mix_values_of_different_types():
+    # 1 == True and hash(1) == hash(True) so cache could mix them up
+    int_switch = matchers.deserialize(matchers.serialize(forking.Switch({
+        1: text.Match('yes'),
+    })))
+    bool_switch = matchers.deserialize(matchers.serialize(forking.Switch({
+        True: text.Match('yes'),
+    })))
+    assert int_switch is not bool_switch
+    assert type(list(int_switch.cases)[0]) is int
+    assert list(bool_switch.cases)[0] is True
+    assert type(matchers.deserialize(matchers.serialize(option.Match(1))).option) is int
+    assert matchers.deserialize(matchers.serialize(option.Match(True))).option is True
+
+
+def test_deserialize_unhashable_data_without_cache():
+    data = {'type': 'Option.Match', 'data': {'unhashable': {1, 2}}}
+    assert matchers.deserialize(data) is not matchers.deserialize(data)
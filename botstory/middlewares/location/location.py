@@ -14,3 +14,10 @@ class Any:
 
     def validate(self, message):
         return is_location(message)
+
+    def dispatch_key(self):
+        return True
+
+    @staticmethod
+    def message_dispatch_key(message):
+        return not not is_location(message)
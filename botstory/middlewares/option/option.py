@@ -1,6 +1,10 @@
 from ... import matchers
 
 
+def get_option(message):
+    return message.get('data', {}).get('option', None)
+
+
 @matchers.matcher()
 class Any:
     type = 'Option.Any'
@@ -11,6 +15,13 @@ class Any:
     def validate(self, message):
         return message.get('data', {}).get('option', False)
 
+    def dispatch_key(self):
+        return True
+
+    @staticmethod
+    def message_dispatch_key(message):
+        return not not get_option(message)
+
 
 @matchers.matcher()
 class Match:
@@ -20,7 +31,7 @@ class Match:
         self.option = option
 
     def validate(self, message):
-        return message.get('data', {}).get('option', None) == self.option
+        return get_option(message) == self.option
 
     def serialize(self):
         return self.option
@@ -29,6 +40,13 @@ class Match:
     def deserialize(option):
         return Match(option)
 
+    def dispatch_key(self):
+        return self.option
+
+    @staticmethod
+    def message_dispatch_key(message):
+        return get_option(message)
+
 
 @matchers.matcher()
 class OnStart:
@@ -36,4 +54,11 @@ class OnStart:
     DEFAULT_OPTION_PAYLOAD = 'BOT_STORY.PUSH_GET_STARTED_BUTTON'
 
     def validate(self, message):
-        return message.get('data', {}).get('option', None) == self.DEFAULT_OPTION_PAYLOAD
+        return get_option(message) == self.DEFAULT_OPTION_PAYLOAD
+
+    def dispatch_key(self):
+        return self.DEFAULT_OPTION_PAYLOAD
+
+    @staticmethod
+    def message_dispatch_key(message):
+        return get_option(message)
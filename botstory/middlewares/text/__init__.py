@@ -1 +1 @@
-from .text import Any, Match
+from .text import Any, Contains, EqualCaseIgnore, Match, Regex
@@ -1,5 +1,21 @@
+import re
+
 from ... import matchers, utils
 
+# flags of regex which could be scoped inside of combined pattern
+SCOPED_FLAGS = (
+    (re.IGNORECASE, 'i'),
+    (re.MULTILINE, 'm'),
+    (re.DOTALL, 's'),
+    (re.VERBOSE, 'x'),
+)
+
+Pattern = type(re.compile(''))
+
+
+def get_raw_text(message):
+    return message.get('data', {}).get('text', {}).get('raw', None)
+
 
 @matchers.matcher()
 class Any:
@@ -12,7 +28,14 @@ class Any:
         pass
 
     def validate(self, message):
-        return message.get('data', {}).get('text', {}).get('raw', None)
+        return get_raw_text(message)
+
+    def dispatch_key(self):
+        return True
+
+    @staticmethod
+    def message_dispatch_key(message):
+        return not not get_raw_text(message)
 
 
 @matchers.matcher()
@@ -23,13 +46,21 @@ class Match:
         self.test_string = test_string
 
     def validate(self, message):
-        return self.test_string == (message.get('data', {}).get('text', {}).get('raw', None))
+        return self.test_string == get_raw_text(message)
+
+    def dispatch_key(self):
+        return self.test_string
+
+    @staticmethod
+    def message_dispatch_key(message):
+        return get_raw_text(message)
 
     def serialize(self):
         return self.test_string
 
-    def deserialize(self, state):
-        self.test_string = state
+    @staticmethod
+    def deserialize(test_string):
+        return Match(test_string)
 
     @staticmethod
     def can_handle(data):
@@ -38,3 +69,132 @@ class Match:
     @staticmethod
     def handle(data):
         return Match(data)
+
+
+@matchers.matcher()
+class EqualCaseIgnore:
+    """
+    case-insensitive equality of raw text
+    """
+    type = 'text.EqualCaseIgnore'
+
+    def __init__(self, test_string):
+        self.test_string = test_string
+        self.lowered = test_string.lower()
+
+    def validate(self, message):
+        raw_text = get_raw_text(message)
+        return raw_text is not None and self.lowered == raw_text.lower()
+
+    def dispatch_key(self):
+        return self.lowered
+
+    @staticmethod
+    def message_dispatch_key(message):
+        raw_text = get_raw_text(message)
+        return raw_text and raw_text.lower()
+
+    def serialize(self):
+        return self.test_string
+
+    @staticmethod
+    def deserialize(test_string):
+        return EqualCaseIgnore(test_string)
+
+
+@matchers.matcher()
+class Regex:
+    """
+    raw text has match of regular expression
+    """
+    type = 'text.Regex'
+
+    message_dispatch_text = staticmethod(get_raw_text)
+
+    def __init__(self, pattern, flags=0):
+        self.pattern = pattern
+        self.flags = flags
+        self.compiled = re.compile(pattern, flags)
+
+    def validate(self, message):
+        raw_text = get_raw_text(message)
+        return raw_text is not None and self.compiled.search(raw_text) is not None
+
+    def dispatch_pattern(self):
+        return scope_pattern(self.pattern, self.flags)
+
+    def serialize(self):
+        return {
+            'pattern': self.pattern,
+            'flags': self.flags,
+        }
+
+    @staticmethod
+    def deserialize(data):
+        return Regex(data['pattern'], data['flags'])
+
+    @staticmethod
+    def can_handle(data):
+        return isinstance(data, Pattern)
+
+    @staticmethod
+    def handle(data):
+        return Regex(data.pattern, data.flags & ~re.UNICODE)
+
+
+@matchers.matcher()
+class Contains:
+    """
+    raw text has one of keywords (as a separate word)
+    """
+    type = 'text.Contains'
+
+    message_dispatch_text = staticmethod(get_raw_text)
+
+    def __init__(self, keywords, ignore_case=True):
+        if utils.is_string(keywords):
+            keywords = [keywords]
+        self.keywords = list(keywords)
+        self.ignore_case = ignore_case
+        self.pattern = r'(?<!\w)(?:{})(?!\w)'.format(
+            '|'.join(re.escape(k) for k in sorted(self.keywords, key=len, reverse=True)))
+        self.flags = re.IGNORECASE if ignore_case else 0
+        self.compiled = re.compile(self.pattern, self.flags)
+
+    def validate(self, message):
+        raw_text = get_raw_text(message)
+        return raw_text is not None and self.compiled.search(raw_text) is not None
+
+    def dispatch_pattern(self):
+        return scope_pattern(self.pattern, self.flags)
+
+    def serialize(self):
+        return {
+            'keywords': self.keywords,
+            'ignore_case': self.ignore_case,
+        }
+
+    @staticmethod
+    def deserialize(data):
+        return Contains(data['keywords'], data['ignore_case'])
+
+
+def scope_pattern(pattern, flags):
+    """
+    apply flags only to the pattern so it could be a part of combined pattern
+
+    :param pattern:
+    :param flags:
+    :return: scoped pattern or None if flags can't be scoped
+    """
+    flags &= ~re.UNICODE
+    letters = ''
+    for flag, letter in SCOPED_FLAGS:
+        if flags & flag:
+            letters += letter
+            flags &= ~flag
+    if flags:
+        return None
+    if not letters:
+        return pattern
+    return '(?{}:{})'.format(letters, pattern)
@@ -1,4 +1,5 @@
 import pytest
+import re
 from . import text
 from ... import matchers, Story
 from ...utils import answer, build_fake_session, build_fake_user, SimpleTrigger
@@ -95,3 +96,76 @@ def test_serialize_text_any():
     m_old = text.Any()
     m_new = matchers.deserialize(matchers.serialize(m_old))
     assert isinstance(m_new, text.Any)
+
+
+def test_serialize_text_match():
+    m_old = text.Match('hello')
+    m_new = matchers.deserialize(matchers.serialize(m_old))
+    assert isinstance(m_new, text.Match)
+    assert m_new.test_string == 'hello'
+
+
+@pytest.mark.asyncio
+async def test_should_run_story_on_regex_match():
+    trigger = SimpleTrigger()
+    session = build_fake_session()
+    user = build_fake_user()
+
+    global story
+    story = Story()
+
+    @story.on(re.compile(r'order #\d+'))
+    def one_story():
+        @story.part()
+        def then(message):
+            trigger.passed()
+
+    await answer.pure_text('where is my order #12?', session, user, story)
+
+    assert trigger.is_triggered
+
+
+@pytest.mark.asyncio
+async def test_should_wait_for_keyword():
+    trigger = SimpleTrigger()
+    session = build_fake_session()
+    user = build_fake_user()
+
+    global story
+    story = Story()
+
+    @story.on('hi')
+    def one_story():
+        @story.part()
+        def ask(message):
+            return text.Contains(['yes', 'sure'])
+
+        @story.part()
+        def then(message):
+            trigger.passed()
+
+    await answer.pure_text('hi', session, user, story)
+    await answer.pure_text('no way', session, user, story)
+    assert not trigger.is_triggered
+
+    await answer.pure_text('hi', session, user, story)
+    await answer.pure_text('Sure, why not', session, user, story)
+    assert trigger.is_triggered
+
+
+def test_match_text_ignoring_case():
+    m = text.EqualCaseIgnore('Hello')
+    assert m.validate({'data': {'text': {'raw': 'hELLO'}}})
+    assert not m.validate({'data': {'text': {'raw': 'hello!'}}})
+    assert not m.validate({'data': {}})
+
+
+@pytest.mark.parametrize('m', [
+    text.EqualCaseIgnore('Hello'),
+    text.Regex('hel+o', re.IGNORECASE),
+    text.Contains(['hello', 'hi'], ignore_case=False),
+])
+def test_serialize_text_matchers(m):
+    m_new = matchers.deserialize(matchers.serialize(m))
+    assert type(m_new) is type(m)
+    assert m_new.serialize() == m.serialize()
@@ -65,6 +65,9 @@ class Story:
     async def say(self, body, user):
         return await self.chat.say(body, user)
 
+    async def broadcast(self, body, users, **kwargs):
+        return await self.chat.broadcast(body, users, **kwargs)
+
     def use(self, middleware):
         """
         attache middleware
@@ -98,6 +101,9 @@ class Story:
         await self._do_for_each_extension('after_start', event_loop)
 
     async def stop(self, event_loop=None):
+        # let extensions finish their work (for example drain queues)
+        # while everything they depend on (for example storage) still works
+        await self._do_for_each_extension('before_stop', event_loop)
         return await self._do_for_each_extension('stop', event_loop)
 
     def forever(self, loop):
@@ -112,9 +118,11 @@ class Story:
         di.injector.register(instance=self.story_processor_instance)
         di.injector.register(instance=self.stories_library)
         di.injector.register(instance=self.users)
+        di.injector.register(instance=self.chat)
         di.injector.bind(self.story_processor_instance, auto=True)
         di.injector.bind(self.stories_library, auto=True)
         di.injector.bind(self.users, auto=True)
+        di.injector.bind(self.chat, auto=True)
 
     async def _do_for_each_extension(self, command, even_loop):
         await asyncio.gather(
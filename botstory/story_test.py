@@ -267,3 +267,30 @@ async def test_should_run_before_start_start_and_then_after_start(mocker):
             call('start'),
             call('after_start'),
         ])
+
+
+@pytest.mark.asyncio
+async def test_should_run_before_stop_of_all_extensions_before_stop(mocker):
+    with di.child_scope():
+        global story
+        story = Story()
+        handler = mocker.stub()
+
+        @di.desc()
+        class QueueExtension:
+            async def before_stop(self):
+                await asyncio.sleep(0.01)
+                handler('drain queue')
+
+        @di.desc()
+        class StorageExtension:
+            async def stop(self):
+                handler('close storage')
+
+        story.use(QueueExtension())
+        story.use(StorageExtension())
+        await story.stop()
+        handler.assert_has_calls([
+            call('drain queue'),
+            call('close storage'),
+        ])
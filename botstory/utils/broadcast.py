@@ -0,0 +1,152 @@
+import asyncio
+import inspect
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncIterator:
+    """
+    async iterator over regular iterable
+    so we could treat lists and db cursors the same way
+    """
+
+    def __init__(self, iterable):
+        self.iterator = iter(iterable)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def to_async_iterator(users):
+    if hasattr(users, '__aiter__'):
+        res = users.__aiter__()
+        # before python 3.5.2 __aiter__ was coroutine
+        if inspect.isawaitable(res):
+            raise TypeError('awaitable __aiter__ is not supported')
+        return res
+    return AsyncIterator(users)
+
+
+def get_user_id(user):
+    for field in ('facebook_user_id', '_id'):
+        try:
+            return user[field]
+        except (KeyError, TypeError):
+            continue
+    return None
+
+
+class Broadcast:
+    """
+    send something to stream of users with bounded concurrency.
+
+    users are pulled from (async) iterator only once there is free worker
+    so audience of any size isn't loaded in memory at once:
+
+        report = await Broadcast(send, concurrency=100).run(storage.iter_users())
+    """
+
+    def __init__(self, send,
+                 concurrency=100,
+                 on_progress=None,
+                 progress_interval=1000,
+                 max_failures=100):
+        """
+
+        :param send: coroutine function which sends to one user
+        :param concurrency: max number of simultaneous sends
+        :param on_progress: (optional) function (or coroutine function)
+        which receives report once in progress_interval users
+        :param progress_interval: how often (in number of users) we report progress
+        :param max_failures: how many failures (user id and error) we keep in report.
+        all of them are counted anyway
+        """
+        self.send = send
+        self.concurrency = concurrency
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.max_failures = max_failures
+
+        self.total = 0
+        self.sent = 0
+        self.failed = 0
+        self.failures = []
+        self.started_at = None
+        self.finished_at = None
+
+    def get_report(self):
+        finished_at = self.finished_at or time.perf_counter()
+        seconds = finished_at - self.started_at if self.started_at else 0
+        return {
+            'total': self.total,
+            'sent': self.sent,
+            'failed': self.failed,
+            'in_progress': self.total - self.sent - self.failed,
+            'failures': list(self.failures),
+            'seconds': seconds,
+            'messages_per_second': self.sent / seconds if seconds else None,
+            'done': self.finished_at is not None,
+        }
+
+    async def report_progress(self):
+        if not self.on_progress:
+            return
+        try:
+            res = self.on_progress(self.get_report())
+            if inspect.isawaitable(res):
+                await res
+        except Exception as err:
+            logger.exception(err)
+
+    async def send_one(self, user):
+        try:
+            await self.send(user)
+            self.sent += 1
+        except Exception as err:
+            logger.debug('fail on broadcast to %s with %s', get_user_id(user), err)
+            self.failed += 1
+            if len(self.failures) < self.max_failures:
+                self.failures.append({
+                    'user_id': get_user_id(user),
+                    'error': str(err),
+                })
+
+    async def run(self, users):
+        """
+        send to all users
+
+        :param users: iterable or async iterable of users
+        :return: report
+        """
+        iterator = to_async_iterator(users)
+        # cursor shouldn't be asked by several workers at once
+        iterator_lock = asyncio.Lock()
+        self.started_at = time.perf_counter()
+
+        async def worker():
+            while True:
+                async with iterator_lock:
+                    try:
+                        user = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        return
+                    self.total += 1
+                    progress = self.total % self.progress_interval == 0
+
+                await self.send_one(user)
+                if progress:
+                    await self.report_progress()
+
+        await asyncio.gather(*[worker() for _ in range(self.concurrency)])
+
+        self.finished_at = time.perf_counter()
+        await self.report_progress()
+        return self.get_report()
@@ -0,0 +1,100 @@
+import asyncio
+import pytest
+
+from . import broadcast
+
+
+class SlowCursor:
+    """
+    async iterable which tells how many users were taken ahead of sends
+    """
+
+    def __init__(self, users):
+        self.users = iter(users)
+        self.taken = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.sleep(0)
+        try:
+            user = next(self.users)
+        except StopIteration:
+            raise StopAsyncIteration
+        self.taken += 1
+        return user
+
+
+@pytest.mark.asyncio
+async def test_send_to_all_users_with_bounded_concurrency():
+    in_progress = 0
+    max_in_progress = 0
+    received = []
+
+    async def send(user):
+        nonlocal in_progress, max_in_progress
+        in_progress += 1
+        max_in_progress = max(max_in_progress, in_progress)
+        await asyncio.sleep(0.001)
+        received.append(user['facebook_user_id'])
+        in_progress -= 1
+
+    users = [{'facebook_user_id': idx} for idx in range(50)]
+    report = await broadcast.Broadcast(send, concurrency=5).run(SlowCursor(users))
+
+    assert sorted(received) == list(range(50))
+    assert max_in_progress == 5
+    assert report['total'] == report['sent'] == 50
+    assert report['failed'] == 0
+    assert report['done']
+
+
+@pytest.mark.asyncio
+async def test_pull_users_only_once_there_is_free_worker():
+    cursor = SlowCursor({'facebook_user_id': idx} for idx in range(1000))
+    taken_ahead = []
+
+    async def send(user):
+        taken_ahead.append(cursor.taken - user['facebook_user_id'])
+        await asyncio.sleep(0)
+
+    await broadcast.Broadcast(send, concurrency=10).run(cursor)
+
+    assert max(taken_ahead) <= 10
+
+
+@pytest.mark.asyncio
+async def test_count_failures_and_keep_only_some_of_them():
+    async def send(user):
+        if user['facebook_user_id'] % 2:
+            raise ValueError('can not send')
+
+    report = await broadcast.Broadcast(send, max_failures=3).run(
+        [{'facebook_user_id': idx} for idx in range(10)])
+
+    assert report['sent'] == 5
+    assert report['failed'] == 5
+    assert len(report['failures']) == 3
+    assert report['failures'][0] == {'user_id': 1, 'error': 'can not send'}
+
+
+@pytest.mark.asyncio
+async def test_report_progress():
+    reports = []
+
+    async def send(user):
+        pass
+
+    async def on_progress(report):
+        reports.append(report)
+
+    await broadcast.Broadcast(send,
+                              concurrency=2,
+                              on_progress=on_progress,
+                              progress_interval=10).run([{'_id': idx} for idx in range(25)])
+
+    assert [r['total'] for r in reports] == [10, 20, 25]
+    assert not reports[0]['done']
+    assert reports[-1]['done']
+    assert reports[-1]['sent'] == 25
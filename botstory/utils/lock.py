@@ -0,0 +1,60 @@
+import asyncio
+
+
+class KeyLock:
+    """
+    async lock for each key.
+    holders of different keys don't wait for each other
+    and lock of key is dropped once nobody holds or waits for it
+
+        key_lock = KeyLock()
+        async with key_lock(user_id):
+            ...
+    """
+
+    def __init__(self):
+        # key -> [lock, number of holders and waiters]
+        self.locks = {}
+
+    def __call__(self, key):
+        return KeyLockContext(self, key)
+
+    def __len__(self):
+        return len(self.locks)
+
+    def locked(self, key):
+        return key in self.locks and self.locks[key][0].locked()
+
+    async def acquire(self, key):
+        item = self.locks.get(key, None)
+        if item is None:
+            item = self.locks[key] = [asyncio.Lock(), 0]
+        item[1] += 1
+        try:
+            await item[0].acquire()
+        except BaseException:
+            self.forget(key)
+            raise
+
+    def release(self, key):
+        self.locks[key][0].release()
+        self.forget(key)
+
+    def forget(self, key):
+        item = self.locks[key]
+        item[1] -= 1
+        if item[1] == 0:
+            del self.locks[key]
+
+
+class KeyLockContext:
+    def __init__(self, key_lock, key):
+        self.key_lock = key_lock
+        self.key = key
+
+    async def __aenter__(self):
+        await self.key_lock.acquire(self.key)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.key_lock.release(self.key)
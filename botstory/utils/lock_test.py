@@ -0,0 +1,48 @@
+import asyncio
+import pytest
+
+from . import lock
+
+
+@pytest.mark.asyncio
+async def test_serialize_holders_of_the_same_key():
+    key_lock = lock.KeyLock()
+    log = []
+
+    async def job(key, name):
+        async with key_lock(key):
+            log.append('start {}'.format(name))
+            await asyncio.sleep(0.01)
+            log.append('end {}'.format(name))
+
+    await asyncio.gather(job('alice', 'a1'), job('alice', 'a2'), job('bob', 'b1'))
+
+    # gather doesn't guarantee which of them starts first
+    # so we only check that holders of one key don't interleave
+    assert log.index('end a1') < log.index('start a2') or \
+           log.index('end a2') < log.index('start a1')
+    # while holder of other key doesn't wait for them
+    assert log.index('start b1') < min(log.index('end a1'), log.index('end a2'))
+
+
+@pytest.mark.asyncio
+async def test_drop_lock_once_nobody_uses_it():
+    key_lock = lock.KeyLock()
+
+    async with key_lock('alice'):
+        assert key_lock.locked('alice')
+        assert len(key_lock) == 1
+
+    assert not key_lock.locked('alice')
+    assert len(key_lock) == 0
+
+
+@pytest.mark.asyncio
+async def test_release_lock_on_exception():
+    key_lock = lock.KeyLock()
+
+    with pytest.raises(ValueError):
+        async with key_lock('alice'):
+            raise ValueError()
+
+    assert len(key_lock) == 0
@@ -0,0 +1,90 @@
+import collections
+import time
+
+
+class LRUCache:
+    """
+    size-bounded cache which evicts least recently used items
+    and (optionally) items which are older than ttl seconds
+
+        cache = LRUCache(max_size=1000, ttl=60)
+        cache.set(key, value)
+        cache.get(key)
+    """
+
+    def __init__(self, max_size=1000, ttl=None, timer=time.monotonic):
+        """
+
+        :param max_size: max number of stored items
+        :param ttl: time to live of item in seconds (None - forever)
+        :param timer: source of current time
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.timer = timer
+        # key -> (expire at, value)
+        self.items = collections.OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        try:
+            expire_at, _ = self.items[key]
+        except KeyError:
+            return False
+        return expire_at is None or expire_at > self.timer()
+
+    def get(self, key, default=None):
+        try:
+            expire_at, value = self.items[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        if expire_at is not None and expire_at <= self.timer():
+            del self.items[key]
+            self.misses += 1
+            return default
+
+        self.items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        """
+
+        :param key:
+        :param value:
+        :param ttl: override default ttl of cache
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expire_at = None if ttl is None else self.timer() + ttl
+        self.items[key] = (expire_at, value)
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        try:
+            _, value = self.items.pop(key)
+        except KeyError:
+            return default
+        return value
+
+    def clear(self):
+        self.items.clear()
+
+    def get_metrics(self):
+        return {
+            'size': len(self.items),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,42 @@
+from . import lru
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_evict_least_recently_used_item():
+    cache = lru.LRUCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert 'c' in cache
+    assert cache.evictions == 1
+
+
+def test_expire_item_after_ttl():
+    timer = FakeTimer()
+    cache = lru.LRUCache(ttl=10, timer=timer)
+    cache.set('a', 1)
+    timer.now = 9
+    assert cache.get('a') == 1
+    timer.now = 10
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_count_hits_and_misses():
+    cache = lru.LRUCache()
+    cache.set('a', None)
+    assert cache.get('a', 'default') is None
+    assert cache.get('b', 'default') == 'default'
+    assert cache.get_metrics()['hits'] == 1
+    assert cache.get_metrics()['misses'] == 1
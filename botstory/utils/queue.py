@@ -1,5 +1,147 @@
 import asyncio
+import functools
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 def add(fn):
-    asyncio.get_event_loop().call_soon_threadsafe(fn)
+    """
+    run coroutine function in background.
+    it isn't bounded so prefer Dispatcher
+
+    :param fn: coroutine function without arguments
+    """
+    asyncio.ensure_future(fn())
+
+
+class WorkQueue:
+    """
+    bounded queue of jobs which are processed by pool of async workers.
+
+    producer waits for free slot once queue is full (backpressure)
+    """
+
+    def __init__(self, handler, maxsize=100, workers=4):
+        """
+
+        :param handler: coroutine function which receives each job
+        :param maxsize: max number of waiting jobs
+        :param workers: number of concurrent workers
+        """
+        self.handler = handler
+        self.maxsize = maxsize
+        self.workers_count = workers
+        self.queue = None
+        self.workers = []
+
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+
+    @property
+    def depth(self):
+        return self.queue.qsize() if self.queue else 0
+
+    def start(self):
+        if self.workers:
+            return
+        logger.debug('start {} workers'.format(self.workers_count))
+        self.queue = self.queue or asyncio.Queue(maxsize=self.maxsize)
+        self.workers = [asyncio.ensure_future(self.work())
+                        for _ in range(self.workers_count)]
+
+    async def put(self, job):
+        self.start()
+        self.received += 1
+        await self.queue.put(job)
+
+    def put_nowait(self, job):
+        """
+        put job without waiting for free slot
+
+        :param job:
+        :return: False if job was dropped because queue is full
+        """
+        self.start()
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.received += 1
+        return True
+
+    async def work(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self.handler(job)
+                self.processed += 1
+            except Exception as err:
+                self.failed += 1
+                logger.exception(err)
+            finally:
+                self.queue.task_done()
+
+    async def stop(self, timeout=None):
+        """
+        wait until all received jobs are processed and stop workers
+
+        :param timeout: how long we wait for the rest of jobs
+        :return:
+        """
+        if not self.workers:
+            return
+        logger.debug('drain queue of {} jobs'.format(self.depth))
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning('stop with {} unprocessed jobs'.format(self.depth))
+
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def get_metrics(self):
+        return {
+            'depth': self.depth,
+            'maxsize': self.maxsize,
+            'workers': len(self.workers),
+            'received': self.received,
+            'processed': self.processed,
+            'failed': self.failed,
+            'dropped': self.dropped,
+        }
+
+
+async def call(fn):
+    await fn()
+
+
+class Dispatcher(WorkQueue):
+    """
+    runs coroutine functions in background by pool of workers.
+    calls are dropped once queue is full so caller never waits
+
+        dispatcher = Dispatcher(maxsize=1000, workers=4)
+        dispatcher.dispatch(tracker.send, 'pageview', '/path')
+        ...
+        await dispatcher.stop()
+    """
+
+    def __init__(self, maxsize=1000, workers=4):
+        super().__init__(call, maxsize=maxsize, workers=workers)
+
+    def dispatch(self, fn, *args, **kwargs):
+        """
+        schedule call of coroutine function
+
+        :return: False if call was dropped
+        """
+        if not self.put_nowait(functools.partial(fn, *args, **kwargs)):
+            logger.warning('drop call of {} because queue is full'.format(fn))
+            return False
+        return True
@@ -0,0 +1,52 @@
+import asyncio
+import pytest
+
+from . import queue
+
+
+@pytest.mark.asyncio
+async def test_dispatch_calls_in_background():
+    calls = []
+
+    async def track(name, value=None):
+        calls.append((name, value))
+
+    dispatcher = queue.Dispatcher(workers=2)
+    assert dispatcher.dispatch(track, 'one', value=1)
+    assert dispatcher.dispatch(track, 'two')
+    await dispatcher.stop()
+
+    assert sorted(calls) == [('one', 1), ('two', None)]
+    assert dispatcher.get_metrics()['processed'] == 2
+    assert dispatcher.workers == []
+
+
+@pytest.mark.asyncio
+async def test_drop_calls_once_queue_is_full():
+    release = asyncio.Event()
+
+    async def wait():
+        await release.wait()
+
+    dispatcher = queue.Dispatcher(maxsize=1, workers=1)
+    assert dispatcher.dispatch(wait)
+    await asyncio.sleep(0)
+    assert dispatcher.dispatch(wait)
+    assert not dispatcher.dispatch(wait)
+    assert dispatcher.get_metrics()['dropped'] == 1
+
+    release.set()
+    await dispatcher.stop()
+    assert dispatcher.get_metrics()['processed'] == 2
+
+
+@pytest.mark.asyncio
+async def test_log_and_count_failed_calls():
+    async def fail():
+        raise Exception('Oops!')
+
+    dispatcher = queue.Dispatcher()
+    dispatcher.dispatch(fail)
+    await dispatcher.stop()
+
+    assert dispatcher.get_metrics()['failed'] == 1
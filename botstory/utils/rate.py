@@ -0,0 +1,170 @@
+import asyncio
+import time
+
+from . import lru
+
+
+class TokenBucket:
+    """
+    token bucket which gives `rate` tokens per second
+    and accumulates at most `capacity` of them.
+
+    tokens are reserved in advance so waiters are served
+    in order of arrival without polling:
+
+        bucket = TokenBucket(rate=10)
+        await bucket.acquire()
+    """
+
+    def __init__(self, rate, capacity=None, timer=time.monotonic):
+        """
+
+        :param rate: number of tokens per second
+        :param capacity: max burst (default - one second of rate)
+        :param timer: source of current time
+        """
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.timer = timer
+        self.tokens = self.capacity
+        # time of the last refill. could be in future once bucket is paused
+        self.updated_at = timer()
+
+    def refill(self):
+        now = self.timer()
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+        return now
+
+    def reserve(self, tokens=1):
+        """
+        take tokens in advance
+
+        :param tokens:
+        :return: how long (in seconds) we should wait before using them
+        """
+        now = self.refill()
+        self.tokens -= tokens
+        delay = max(self.updated_at - now, 0)
+        if self.tokens < 0:
+            delay += -self.tokens / self.rate
+        return delay
+
+    async def acquire(self, tokens=1):
+        """
+        wait for tokens
+
+        :param tokens:
+        :return: how long (in seconds) we have waited
+        """
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    def pause(self, seconds):
+        """
+        don't give new tokens for the next `seconds`
+        (for example once server has asked us to retry after)
+
+        :param seconds:
+        """
+        now = self.refill()
+        self.updated_at = max(self.updated_at, now + seconds)
+        self.tokens = min(self.tokens, 0)
+
+
+class RateLimiter:
+    """
+    global token bucket plus token bucket of each key (for example recipient).
+    buckets of keys are kept in LRU cache so their number is bounded
+
+        limiter = RateLimiter(rate=100, per_key_rate=1)
+        await limiter.acquire(recipient_id)
+    """
+
+    def __init__(self,
+                 rate=None, capacity=None,
+                 per_key_rate=None, per_key_capacity=None,
+                 max_keys=10000,
+                 timer=time.monotonic):
+        """
+
+        :param rate: global number of tokens per second (None - unlimited)
+        :param capacity: global max burst
+        :param per_key_rate: number of tokens per second for each key (None - unlimited)
+        :param per_key_capacity: max burst of each key
+        :param max_keys: max number of remembered buckets of keys
+        :param timer: source of current time
+        """
+        self.timer = timer
+        self.bucket = rate and TokenBucket(rate, capacity, timer=timer)
+        self.per_key_rate = per_key_rate
+        self.per_key_capacity = per_key_capacity
+        self.buckets = lru.LRUCache(max_size=max_keys)
+        # global pause when we don't have global bucket
+        self.paused_until = None
+
+        self.acquired = 0
+        self.delayed = 0
+        self.waited = 0
+
+    def get_bucket(self, key):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.per_key_rate, self.per_key_capacity, timer=self.timer)
+            self.buckets.set(key, bucket)
+        return bucket
+
+    async def acquire(self, key=None):
+        """
+        wait for token of key and then for global token
+        so one busy key doesn't hold global tokens while it waits for its own
+
+        :param key: (optional)
+        :return: how long (in seconds) we have waited
+        """
+        waited = 0
+        if key is not None and self.per_key_rate:
+            waited += await self.get_bucket(key).acquire()
+        if self.bucket:
+            waited += await self.bucket.acquire()
+        elif self.paused_until is not None:
+            delay = self.paused_until - self.timer()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                waited += delay
+            else:
+                self.paused_until = None
+
+        self.acquired += 1
+        if waited > 0:
+            self.delayed += 1
+            self.waited += waited
+        return waited
+
+    def pause(self, seconds, key=None):
+        """
+        slow down globally or only for key.
+        global pause works even without global rate
+
+        :param seconds:
+        :param key: (optional)
+        """
+        if key is not None and self.per_key_rate:
+            self.get_bucket(key).pause(seconds)
+        elif self.bucket:
+            self.bucket.pause(seconds)
+        else:
+            paused_until = self.timer() + seconds
+            if self.paused_until is None or paused_until > self.paused_until:
+                self.paused_until = paused_until
+
+    def get_metrics(self):
+        return {
+            'acquired': self.acquired,
+            'delayed': self.delayed,
+            'waited': self.waited,
+            'keys': len(self.buckets),
+        }
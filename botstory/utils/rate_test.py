@@ -0,0 +1,78 @@
+import asyncio
+import pytest
+
+from . import rate
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_give_burst_and_then_reserve_tokens_in_advance():
+    timer = FakeTimer()
+    bucket = rate.TokenBucket(rate=2, capacity=2, timer=timer)
+
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1)
+
+
+def test_refill_tokens_up_to_capacity():
+    timer = FakeTimer()
+    bucket = rate.TokenBucket(rate=2, capacity=2, timer=timer)
+    bucket.reserve()
+    bucket.reserve()
+
+    timer.now = 10
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() > 0
+
+
+def test_do_not_give_tokens_while_paused():
+    timer = FakeTimer()
+    bucket = rate.TokenBucket(rate=10, timer=timer)
+    bucket.pause(3)
+
+    assert bucket.reserve() == pytest.approx(3.1)
+
+    timer.now = 5
+    assert bucket.reserve() == 0
+
+
+@pytest.mark.asyncio
+async def test_limit_each_key_separately():
+    timer = FakeTimer()
+    limiter = rate.RateLimiter(per_key_rate=100, per_key_capacity=1, timer=timer)
+
+    assert await limiter.acquire('alice') == 0
+    assert await limiter.acquire('bob') == 0
+    assert await limiter.acquire('alice') == pytest.approx(0.01)
+    assert limiter.get_metrics() == {
+        'acquired': 3,
+        'delayed': 1,
+        'waited': pytest.approx(0.01),
+        'keys': 2,
+    }
+
+
+@pytest.mark.asyncio
+async def test_unlimited_by_default():
+    limiter = rate.RateLimiter()
+    waited = await asyncio.gather(*[limiter.acquire(idx % 3) for idx in range(100)])
+    assert sum(waited) == 0
+    assert limiter.get_metrics()['keys'] == 0
+
+
+@pytest.mark.asyncio
+async def test_pause_globally_without_global_rate():
+    limiter = rate.RateLimiter(per_key_rate=100)
+    limiter.pause(0.01)
+
+    assert await limiter.acquire('alice') == pytest.approx(0.01, abs=0.005)
+    assert await limiter.acquire('bob') == 0